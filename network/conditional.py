@@ -0,0 +1,144 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import BuddyLink
+from .versioning import bump_version, get_versions
+
+# network/conditional.py
+#
+# ETag / Last-Modified validators for per-user pages and images, so a
+# browser (or a proxy) revalidating an unchanged page gets a 304 before
+# the view queries or renders anything. Validators come from version
+# stamps that network/signals.py touches on the writes a page depends on:
+#
+#   page:profile:<id>   the profile, its user, picture or courses
+#   page:buddies:<id>   the buddy list, or any buddy's profile
+#   page:events         any event
+#   page:courses        any course (names show on profile pages)
+#
+# Responses stay private (they are per user) and are revalidated on every
+# use; the CSRF cookie is part of every page ETag so a cached page never
+# carries a token from an earlier session.
+
+EVENTS_PAGE_STAMP = 'page:events'
+COURSES_PAGE_STAMP = 'page:courses'
+CHANGED_AT_KEY = 'network:changed:{name}'
+
+
+def profile_page_stamp(profile_id):
+    return f'page:profile:{profile_id}'
+
+
+def buddies_page_stamp(profile_id):
+    return f'page:buddies:{profile_id}'
+
+
+def touch(names):
+    # Called on commit of a write that changes what these stamps cover
+    names = set(names)
+    if not names:
+        return
+    for name in names:
+        bump_version(name)
+    now = time.time()
+    cache.set_many({CHANGED_AT_KEY.format(name=name): now for name in names}, timeout=None)
+
+
+def profile_pages_changed(profile_id):
+    # Their own pages, and the buddy list of everyone showing their card
+    owner_ids = BuddyLink.objects.filter(buddy_id=profile_id).values_list('owner_id', flat=True)
+    touch([profile_page_stamp(profile_id), *(buddies_page_stamp(owner_id) for owner_id in owner_ids)])
+
+
+def etag_for(parts, weak=True):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def page_validators(request, names, extra=()):
+    """
+    ``(etag, last_modified)`` for a page built from the stamps ``names``
+    (plus any ``extra`` ETag parts), for the requesting user.
+    """
+    versions = get_versions(names)
+    changed = cache.get_many([CHANGED_AT_KEY.format(name=name) for name in names])
+    etag = etag_for([
+        request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *(versions[name] for name in names),
+        *extra,
+    ])
+    # A stamp not touched since the cache started may have changed at any
+    # time before, so it counts as changed when first seen
+    now = time.time()
+    for name in names:
+        key = CHANGED_AT_KEY.format(name=name)
+        if key not in changed:
+            cache.add(key, now, timeout=None)
+            changed[key] = cache.get(key, now)
+    last_modified = None
+    if changed:
+        last_modified = datetime.fromtimestamp(max(changed.values()), tz=timezone.utc)
+    return etag, last_modified
+
+
+def conditional_page(stamps):
+    """
+    View decorator: answer GET/HEAD with 304 when nothing the page is built
+    from has changed. ``stamps(request, *args, **kwargs)`` returns the stamp
+    names and extra ETag parts, ``(names, extra)``, or None to always render.
+    """
+    def decorator(view):
+        def validators(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return None
+            if not hasattr(request, '_page_validators'):
+                found = stamps(request, *args, **kwargs)
+                request._page_validators = page_validators(request, *found) if found else None
+            return request._page_validators
+
+        def etag(request, *args, **kwargs):
+            found = validators(request, *args, **kwargs)
+            return found[0] if found else None
+
+        def last_modified(request, *args, **kwargs):
+            found = validators(request, *args, **kwargs)
+            return found[1] if found else None
+
+        conditioned = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditioned(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped
+    return decorator
+
+
+def not_modified(request, parts):
+    """
+    For views that already hold their cache key: a 304 if the client has
+    the version identified by ``parts``, else None. Returns the ETag too,
+    for the full response.
+    """
+    etag = etag_for(parts, weak=False)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response, etag
+
+
+def set_validators(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,41 @@
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+
+from .models import Course
+
+# network/courses.py
+#
+# Course search for the profile form's autocomplete, so the page never
+# lists the whole catalog. Matches are case-insensitive: a code prefix
+# ("CS1" finds CS101) through course_code_prefix_idx, or, from
+# COURSE_SEARCH_NAME_MIN_LENGTH characters on, a substring of the name
+# through the pg_trgm index course_name_trgm_idx (migration 0014, which
+# needs pg_trgm on the server). Code matches come first.
+
+COURSE_SEARCH_PAGE_SIZE = 20
+COURSE_SEARCH_MAX_PAGE_SIZE = 50
+COURSE_SEARCH_NAME_MIN_LENGTH = 3  # trigrams need three characters
+COURSE_SEARCH_MAX_LENGTH = 100
+
+
+def search_courses(query, page=1, page_size=COURSE_SEARCH_PAGE_SIZE):
+    """``(courses, has_next)`` for one page of matches for ``query``."""
+    query = query.strip()[:COURSE_SEARCH_MAX_LENGTH].upper()
+    if not query:
+        return [], False
+
+    code_match = Q(upper_code__startswith=query)
+    condition = code_match
+    if len(query) >= COURSE_SEARCH_NAME_MIN_LENGTH:
+        condition |= Q(upper_name__contains=query)
+
+    offset = (page - 1) * page_size
+    courses = list(
+        Course.objects
+        .annotate(upper_code=Upper('code'), upper_name=Upper('name'))
+        .filter(condition)
+        .annotate(code_first=Case(When(code_match, then=Value(0)), default=Value(1), output_field=IntegerField()))
+        .order_by('code_first', 'code')
+        .only('id', 'code', 'name')[offset:offset + page_size + 1]
+    )
+    return courses[:page_size], len(courses) > page_size
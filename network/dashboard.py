@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import weakref
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .instrumentation import incr, span
+from .models import StudyBuddyInvite, UserCourse, WEEKDAY_CHOICES, mask_to_weekdays
+from .rec_cache import cached_foaf_recommendations, cached_suggestions
+
+# network/dashboard.py
+#
+# Everything the dashboard template needs, collected in a fixed number of
+# queries no matter how many suggestions, FOAFs or invites there are.
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS_PER_PAGE = 10
+DASHBOARD_FOAF_LIMIT = 12
+
+# Queries the builder is expected to need; going over it is logged
+DASHBOARD_QUERY_BUDGET = 10
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def suggestions_stage(user_profile, page):
+    # Suggestions are paged; ask for one extra to know if there is a next page
+    suggestions = cached_suggestions(
+        user_profile,
+        limit=SUGGESTIONS_PER_PAGE + 1,
+        offset=(page - 1) * SUGGESTIONS_PER_PAGE,
+    )
+    return suggestions[:SUGGESTIONS_PER_PAGE], len(suggestions) > SUGGESTIONS_PER_PAGE
+
+
+def foaf_stage(user_profile):
+    # Profiles, mutual buddies and courses come back with the recommendations
+    # (cached entries are shared, so only ever set the same attributes)
+    weekday_labels = dict(WEEKDAY_CHOICES)
+    foaf_suggestions = []
+    for foaf in cached_foaf_recommendations(user_profile, limit=DASHBOARD_FOAF_LIMIT):
+        profile = foaf["profile"]
+        profile.buddy_names = foaf["buddy_names"]
+        profile.course_names = [course.name for course in foaf["courses"]]
+        profile.available_days = profile.available_weekdays
+        profile.common_courses = [course.name for course in foaf["shared_courses"]]
+
+        shared_mask = user_profile.available_weekdays_mask & profile.available_weekdays_mask
+        profile.shared_days = [weekday_labels[code] for code in mask_to_weekdays(shared_mask)]
+
+        foaf_suggestions.append(profile)
+    return foaf_suggestions
+
+
+def invites_stage(user_profile):
+    return list(
+        StudyBuddyInvite.objects
+        .filter(receiver=user_profile, status='pending')
+        .select_related('sender__user')
+    )
+
+
+def has_courses_stage(user_profile):
+    return UserCourse.objects.filter(user_profile=user_profile).exists()
+
+
+def _dashboard_context(user_profile, page, suggestions, foaf_suggestions, incoming_invites, has_courses, query_count):
+    if query_count > DASHBOARD_QUERY_BUDGET:
+        logger.warning(
+            "Dashboard for profile %s used %d queries (budget %d)",
+            user_profile.id, query_count, DASHBOARD_QUERY_BUDGET,
+        )
+
+    suggestions, has_next_page = suggestions
+    return {
+        'suggestions': suggestions,
+        'suggestions_page': page,
+        'suggestions_has_next': has_next_page,
+        'user_profile': user_profile,
+        'incoming_invites': incoming_invites,
+        'week_days_map': {0: 'Mon', 1: 'Tue', 2: 'Wed', 3: 'Thu', 4: 'Fri', 5: 'Sat', 6: 'Sun'},
+        'foaf_suggestions': foaf_suggestions,
+        'profile_complete': has_courses and bool(user_profile.available_weekdays),
+        'query_count': query_count,
+    }
+
+
+def build_dashboard_context(user_profile, page=1):
+    with span('dashboard.build'), count_queries() as counter:
+        suggestions = suggestions_stage(user_profile, page)
+        foaf_suggestions = foaf_stage(user_profile)
+        incoming_invites = invites_stage(user_profile)
+        has_courses = has_courses_stage(user_profile)
+    return _dashboard_context(
+        user_profile, page, suggestions, foaf_suggestions, incoming_invites, has_courses, counter.count,
+    )
+
+
+# --- Async variant, for the ASGI deployment (NETWORK_ASYNC_DASHBOARD) ---
+#
+# The stages are independent, so they run at the same time, each in its
+# own worker thread (and database connection). A stage that fails or takes
+# longer than DASHBOARD_STAGE_TIMEOUT is left out of the page instead of
+# holding it up; its thread is not interrupted, but keeps its slot in the
+# DASHBOARD_STAGE_CONCURRENCY limit until it finishes.
+
+# What the page shows for a stage that did not make it
+STAGE_FALLBACKS = {
+    'suggestions': ([], False),
+    'foaf': [],
+    'invites': [],
+    'has_courses': True,  # rather than nag about an unknown profile
+}
+
+_stage_slots = weakref.WeakKeyDictionary()  # event loop -> semaphore
+
+
+def _slots():
+    loop = asyncio.get_running_loop()
+    slots = _stage_slots.get(loop)
+    if slots is None:
+        slots = _stage_slots[loop] = asyncio.Semaphore(getattr(settings, 'DASHBOARD_STAGE_CONCURRENCY', 8))
+    return slots
+
+
+def _counted(stage, *args):
+    # Runs in a worker thread: count this thread's queries, and close its
+    # connection as a request would when done
+    try:
+        with count_queries() as counter:
+            return stage(*args), counter.count
+    finally:
+        close_old_connections()
+
+
+async def _run_stage(name, stage, *args):
+    """``(result, queries, ok)`` of one stage, or its fallback when it fails or times out."""
+    timeout = getattr(settings, 'DASHBOARD_STAGE_TIMEOUTS', {}).get(
+        name, getattr(settings, 'DASHBOARD_STAGE_TIMEOUT', 2.0))
+    slots = _slots()
+
+    def finished(task):
+        slots.release()
+        if not task.cancelled():
+            task.exception()  # retrieved, so a stage given up on does not warn later
+
+    async def run():
+        await slots.acquire()
+        task = asyncio.ensure_future(sync_to_async(_counted, thread_sensitive=False)(stage, *args))
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    try:
+        with span(f'dashboard.stage.{name}'):
+            result, queries = await asyncio.wait_for(run(), timeout)
+        return result, queries, True
+    except asyncio.TimeoutError:
+        incr(f'dashboard.stage.{name}.timeouts')
+        logger.warning("Dashboard stage %s for profile %s timed out after %ss", name, args[0].id, timeout)
+    except Exception:
+        incr(f'dashboard.stage.{name}.errors')
+        logger.exception("Dashboard stage %s for profile %s failed", name, args[0].id)
+    return STAGE_FALLBACKS[name], 0, False
+
+
+async def abuild_dashboard_context(user_profile, page=1):
+    """build_dashboard_context(), with the stages run concurrently."""
+    with span('dashboard.build_async'):
+        (suggestions, foafs, invites, has_courses) = await asyncio.gather(
+            _run_stage('suggestions', suggestions_stage, user_profile, page),
+            _run_stage('foaf', foaf_stage, user_profile),
+            _run_stage('invites', invites_stage, user_profile),
+            _run_stage('has_courses', has_courses_stage, user_profile),
+        )
+    context = _dashboard_context(
+        user_profile, page, suggestions[0], foafs[0], invites[0], has_courses[0],
+        sum(stage[1] for stage in (suggestions, foafs, invites, has_courses)),
+    )
+    context['unavailable'] = [
+        name for name, stage in zip(('suggestions', 'foaf', 'invites'), (suggestions, foafs, invites))
+        if not stage[2]
+    ]
+    return context
@@ -0,0 +1,82 @@
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from .models import EventAudience, UserProfile
+
+# network/events.py
+#
+# Upcoming-events feed and event audiences, both read from EventAudience
+# (see Event.save()). An event targets a school, a major, both or neither;
+# a profile sees it when every target it sets matches.
+
+EVENTS_PAGE_SIZE = 20
+
+
+def events_for(user_profile):
+    # Audience rows for everything ``user_profile`` may see: targeted at their
+    # school and/or major, or at nobody in particular.
+    return EventAudience.objects.filter(
+        school__in={user_profile.school or '', ''},
+        major__in={user_profile.major or '', ''},
+    )
+
+
+def encode_cursor(audience):
+    return f"{audience.date.isoformat()}|{audience.time.isoformat()}|{audience.event_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        day, at, event_id = cursor.split('|')
+        day, at, event_id = parse_date(day), parse_time(at), int(event_id)
+    except (AttributeError, ValueError):
+        return None
+    if day is None or at is None:
+        return None
+    return day, at, event_id
+
+
+def upcoming_events_page(user_profile, after=None, page_size=EVENTS_PAGE_SIZE, today=None):
+    """
+    One page of upcoming events for ``user_profile``, soonest first,
+    starting just after the ``after`` cursor. Returns
+    ``(events, cursor for the next page or None)``.
+    """
+    today = today or timezone.localdate()
+    audiences = events_for(user_profile) \
+        .filter(date__gte=today) \
+        .select_related('event__organizer__user') \
+        .order_by('date', 'time', 'event_id')
+    position = decode_cursor(after) if after else None
+    if position is not None:
+        day, at, event_id = position
+        audiences = audiences.filter(
+            Q(date__gt=day) | Q(date=day, time__gt=at) | Q(date=day, time=at, event_id__gt=event_id)
+        )
+
+    page = list(audiences[:page_size + 1])
+    next_cursor = encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return [audience.event for audience in page[:page_size]], next_cursor
+
+
+def event_audience_filter(event):
+    # Q matching the profiles ``event`` is for, or None if it is for nobody
+    condition = None
+    for school, major in event.audiences.values_list('school', 'major'):
+        target = Q()
+        if school:
+            target &= Q(school=school)
+        if major:
+            target &= Q(major=major)
+        if not target:
+            return Q()  # untargeted: everyone
+        condition = target if condition is None else condition | target
+    return condition
+
+
+def get_event_participants(event):
+    condition = event_audience_filter(event)
+    if condition is None:
+        return UserProfile.objects.none()
+    return UserProfile.objects.filter(condition)
@@ -1,8 +1,22 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.urls import reverse_lazy
 from .models import UserProfile, WEEKDAY_CHOICES, Course, User, DirectMessage
 
 
+class CourseSearchWidget(forms.SelectMultiple):
+    # Renders only the selected courses; the page adds more through the
+    # course_search endpoint (see network/courses.py), so the catalog is
+    # never listed in full
+    def __init__(self, attrs=None):
+        super().__init__({'data-search-url': reverse_lazy('course_search'), **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        ids = [int(v) for v in value if str(v).isdigit()]
+        self.choices = [(course.id, str(course)) for course in Course.objects.filter(id__in=ids).order_by('code')]
+        return super().optgroups(name, value, attrs)
+
+
 class UserProfileForm(forms.ModelForm):
     available_weekdays = forms.MultipleChoiceField(
         required=False,
@@ -11,10 +25,11 @@ class UserProfileForm(forms.ModelForm):
         label="Which days can you usually study?"
     )
 
+    # Validation only looks up the submitted ids, not the whole catalog
     enrolled_courses = forms.ModelMultipleChoiceField(
-        queryset=Course.objects.none(),
+        queryset=Course.objects.all(),
         required=False,
-
+        widget=CourseSearchWidget,
     )
 
     class Meta:
@@ -39,11 +54,8 @@ class UserProfileForm(forms.ModelForm):
         if self.instance and self.instance.available_weekdays:
             self.initial['available_weekdays'] = self.instance.available_weekdays
 
-        # FIX: Set queryset to all courses for enrolled_courses
-        self.fields['enrolled_courses'].queryset = Course.objects.all()
-        # Optionally, check the instance's current courses:
         if self.instance.pk:
-            self.initial['enrolled_courses'] = self.instance.courses.all()
+            self.initial['enrolled_courses'] = list(self.instance.courses.values_list('id', flat=True))
 
     def clean_available_weekdays(self):
         # This will ensure the data goes in as a list, suitable for ArrayField
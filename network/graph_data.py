@@ -0,0 +1,110 @@
+import json
+
+from .graph_store import edge_key, study_graph
+from .rec_cache import cached_foaf_recommendations, cached_suggestions
+
+# network/graph_data.py
+#
+# The study network as JSON, for drawing it in the browser instead of
+# rendering a PNG (see study_graph_data in views.py). A response is either
+# the whole view ("full") or, with ?since=<version>, only the nodes and
+# edges touched since that version ("delta"); the client keeps
+# ``version`` and sends it back next time. A delta that can no longer be
+# served (the change log moved on, or another process changed the graph)
+# falls back to a full response, so clients just replace their state then.
+# In a delta, listed nodes and edges replace the client's copies, and
+# edges of removed nodes go with them.
+#
+#   ?scope=user     the user, everyone they are buddies with or have an
+#                   invite with, and the edges among them (default)
+#   ?scope=network  everyone
+#
+# Recommendations are not part of the graph versioning; every response
+# carries the current list.
+
+GRAPH_DATA_SUGGESTIONS = 20
+GRAPH_DATA_FOAFS = 10
+
+
+def _node(node, label, center, edges_to_center):
+    edge = edges_to_center.get(node)
+    if node == center:
+        role = 'self'
+    elif edge is None:
+        role = 'other'
+    elif edge['buddies']:
+        role = 'buddy'
+    else:
+        role = 'invited'
+    return {'id': node, 'label': label, 'role': role}
+
+
+def _edge(key, data):
+    edge = {'source': key[0], 'target': key[1], 'type': data.get('type'), 'buddies': bool(data['buddies'])}
+    if 'status' in data:
+        edge['status'] = data['status']
+    return edge
+
+
+def recommendations_for(user_profile):
+    recommendations = [
+        {'id': s['profile'].id, 'label': s['profile'].user.username, 'kind': 'suggestion', 'score': s['score']}
+        for s in cached_suggestions(user_profile, limit=GRAPH_DATA_SUGGESTIONS)
+    ]
+    recommendations += [
+        {'id': f['id'], 'label': f['name'], 'kind': 'foaf', 'mutual_count': f['mutual_count']}
+        for f in cached_foaf_recommendations(user_profile, limit=GRAPH_DATA_FOAFS)
+    ]
+    return recommendations
+
+
+def graph_data(user_profile, scope='user', since=None):
+    """
+    The response for ``user_profile`` as a dict, read from the graph under
+    its lock in one go; nodes and edges are generators, to be serialised
+    with stream_graph_data().
+    """
+    center = user_profile.id
+
+    def view(nodes=None, edges=None):
+        if scope == 'network':
+            return study_graph.whole_view(nodes, edges)
+        return study_graph.user_view(center, nodes, edges)
+
+    # One lock for the change log and the read, so no change falls in between
+    with study_graph.lock:
+        changes = study_graph.changes_since(since) if since is not None else None
+        if changes is None:
+            version, labels, edges = view()
+            data = {'mode': 'full', 'version': version}
+        else:
+            _, touched_nodes, touched_edges = changes
+            version, labels, edges = view(touched_nodes, touched_edges)
+            data = {
+                'mode': 'delta', 'version': version, 'since': since,
+                'removed_nodes': sorted(touched_nodes - set(labels)),
+                'removed_edges': sorted(list(key) for key in touched_edges - set(edges)),
+            }
+        # Roles come from the edges at the centre, touched or not
+        _, _, own_edges = study_graph.whole_view([center], [edge_key(center, node) for node in labels])
+    edges_to_center = {u if v == center else v: edge for (u, v), edge in own_edges.items()}
+    data['nodes'] = (_node(node, label, center, edges_to_center) for node, label in sorted(labels.items()))
+    data['edges'] = (_edge(key, edge) for key, edge in sorted(edges.items()))
+    data['recommendations'] = recommendations_for(user_profile)
+    return data
+
+
+def stream_graph_data(data):
+    # One JSON document, written a node or an edge at a time so large
+    # graphs start arriving before the whole response is encoded
+    lists = ('nodes', 'edges', 'removed_nodes', 'removed_edges', 'recommendations')
+    header = {key: value for key, value in data.items() if key not in lists}
+    yield json.dumps(header)[:-1]
+    for key in lists:
+        if key not in data:
+            continue
+        yield f', "{key}": ['
+        for i, item in enumerate(data[key]):
+            yield (', ' if i else '') + json.dumps(item)
+        yield ']'
+    yield '}\n'
@@ -0,0 +1,247 @@
+from collections import deque
+
+from .models import UserProfile, StudyBuddy, StudyBuddyInvite
+from .versioning import VersionedStore
+
+# network/graph_store.py
+#
+# The study network is built once per process and then kept current by the
+# deltas sent from network/signals.py (see VersionedStore). The nodes and
+# edges each delta touched are kept for the last GRAPH_CHANGELOG_SIZE
+# versions, so clients can ask for only what changed since a version.
+# networkx is imported on the first build, not when the app starts.
+
+GRAPH_VERSION_NAME = 'study_graph'
+GRAPH_CHANGELOG_SIZE = 1000
+
+
+def edge_key(u, v):
+    return (u, v) if u <= v else (v, u)
+
+
+def _edge_data(G, u, v):
+    if not G.has_edge(u, v):
+        G.add_edge(u, v, buddies=0, invites={})
+    return G.edges[u, v]
+
+
+def _refresh_edge(G, u, v):
+    # An edge can come from a StudyBuddy row, from invites, or from both.
+    # Invites win for the displayed type, like in the original full rebuild.
+    data = G.edges[u, v]
+    if not data['buddies'] and not data['invites']:
+        G.remove_edge(u, v)
+    elif data['invites']:
+        latest_invite = max(data['invites'])
+        data['type'] = 'invite'
+        data['status'] = data['invites'][latest_invite]
+    else:
+        data['type'] = 'study_buddy'
+        data.pop('status', None)
+
+
+def build_graph():
+    import networkx as nx
+
+    G = nx.Graph()
+    for profile_id, username in UserProfile.objects.values_list('id', 'user__username'):
+        G.add_node(profile_id, label=username)
+
+    # Accepted connections
+    for one_id, two_id in StudyBuddy.objects.values_list('participant_one_id', 'participant_two_id'):
+        _edge_data(G, one_id, two_id)['buddies'] += 1
+
+    # All invites, whatever their status
+    invites = StudyBuddyInvite.objects.values_list('id', 'sender_id', 'receiver_id', 'status')
+    for invite_id, sender_id, receiver_id, status in invites:
+        _edge_data(G, sender_id, receiver_id)['invites'][invite_id] = status
+
+    for u, v in list(G.edges()):
+        _refresh_edge(G, u, v)
+    return G
+
+
+def ego_nodes(G, center, radius, max_nodes):
+    # Breadth-first from ``center`` so the closest nodes survive the cap
+    if center not in G:
+        return []
+    nodes = [center]
+    seen = {center}
+    frontier = [center]
+    for _ in range(radius):
+        next_frontier = []
+        for node in frontier:
+            for neighbor in G.neighbors(node):
+                if neighbor in seen:
+                    continue
+                if len(nodes) >= max_nodes:
+                    return nodes
+                seen.add(neighbor)
+                nodes.append(neighbor)
+                next_frontier.append(neighbor)
+        frontier = next_frontier
+    return nodes
+
+
+class StudyGraphStore(VersionedStore):
+    version_name = GRAPH_VERSION_NAME
+
+    def __init__(self):
+        super().__init__()
+        self._changes = deque(maxlen=GRAPH_CHANGELOG_SIZE)  # (version, node ids, edge keys)
+
+    def load(self):
+        # Whatever changed before a reload is unknown to us
+        self._changes.clear()
+        return build_graph()
+
+    def _apply_logged(self, change):
+        # ``change`` returns the (node ids, edge keys) it touched
+        with self.lock:
+            touched = self._apply(change)
+            if touched is None or self._stale:
+                self._changes.clear()
+                return
+            if self._changes and self._changes[-1][0] != self.version - 1:
+                self._changes.clear()
+            self._changes.append((self.version, *touched))
+
+    def changes_since(self, version):
+        """
+        ``(version, node ids, edge keys)`` touched after ``version``, or None
+        when the change log does not reach back that far.
+        """
+        with self.lock:
+            self._current()
+            if version == self.version:
+                return self.version, set(), set()
+            if version > self.version or not self._changes or self._changes[0][0] > version + 1:
+                return None
+            nodes, edges = set(), set()
+            for changed_version, changed_nodes, changed_edges in self._changes:
+                if changed_version > version:
+                    nodes.update(changed_nodes)
+                    edges.update(changed_edges)
+            return self.version, nodes, edges
+
+    def graph(self):
+        """Live graph; hold ``lock`` while reading it and never modify it."""
+        with self.lock:
+            return self._current()
+
+    def snapshot(self):
+        with self.lock:
+            return self._current().copy()
+
+    def versioned_snapshot(self):
+        with self.lock:
+            return self._current().copy(), self.version
+
+    def ego_snapshot(self, center, radius, max_nodes, extra_nodes=()):
+        """
+        Copy of the ``radius``-hop neighbourhood of ``center`` plus
+        ``extra_nodes`` (e.g. recommendations), capped at ``max_nodes``.
+        """
+        with self.lock:
+            G = self._current()
+            nodes = ego_nodes(G, center, radius, max_nodes)
+            chosen = set(nodes)
+            for node in extra_nodes:
+                if len(nodes) >= max_nodes:
+                    break
+                if node in G and node not in chosen:
+                    chosen.add(node)
+                    nodes.append(node)
+            return G.subgraph(nodes).copy(), self.version
+
+    def user_view(self, center, nodes=None, edges=None):
+        """
+        ``(version, {node: label}, {edge key: data})`` for ``center``, its
+        neighbours and the edges among them. With ``nodes``/``edges``, only
+        those of them that are in the view, plus every edge of those nodes
+        inside the view (a node may have just joined it).
+        """
+        with self.lock:
+            G = self._current()
+            if center not in G:
+                return self.version, {}, {}
+            members = {center, *G.neighbors(center)}
+            wanted = members if nodes is None else members & set(nodes)
+            labels = {node: G.nodes[node].get('label', str(node)) for node in wanted}
+            if edges is None or nodes is not None:
+                edges = {*(edges or ()), *(edge_key(u, v) for u in wanted for v in G.neighbors(u) if v in members)}
+            data = {
+                (u, v): dict(G.edges[u, v])
+                for u, v in edges
+                if u in members and v in members and G.has_edge(u, v)
+            }
+            return self.version, labels, data
+
+    def whole_view(self, nodes=None, edges=None):
+        """Like user_view(), for the whole network."""
+        with self.lock:
+            G = self._current()
+            nodes = G.nodes if nodes is None else [node for node in nodes if node in G]
+            labels = {node: G.nodes[node].get('label', str(node)) for node in nodes}
+            if edges is None:
+                edges = (edge_key(u, v) for u, v in G.edges)
+            data = {(u, v): dict(G.edges[u, v]) for u, v in edges if G.has_edge(u, v)}
+            return self.version, labels, data
+
+    def neighbors(self, node):
+        with self.lock:
+            G = self._current()
+            if node not in G:
+                return set()
+            return set(G.neighbors(node))
+
+    # --- Deltas, called from network/signals.py ---
+
+    def profile_saved(self, profile_id, username):
+        def change(G):
+            G.add_node(profile_id, label=username)
+            return {profile_id}, set()
+        self._apply_logged(change)
+
+    def profile_deleted(self, profile_id):
+        def change(G):
+            if profile_id not in G:
+                return {profile_id}, set()
+            neighbors = set(G.neighbors(profile_id))
+            G.remove_node(profile_id)
+            return {profile_id, *neighbors}, {edge_key(profile_id, other) for other in neighbors}
+        self._apply_logged(change)
+
+    def buddy_added(self, one_id, two_id):
+        def change(G):
+            _edge_data(G, one_id, two_id)['buddies'] += 1
+            _refresh_edge(G, one_id, two_id)
+            return {one_id, two_id}, {edge_key(one_id, two_id)}
+        self._apply_logged(change)
+
+    def buddy_removed(self, one_id, two_id):
+        def change(G):
+            if G.has_edge(one_id, two_id):
+                data = G.edges[one_id, two_id]
+                data['buddies'] = max(data['buddies'] - 1, 0)
+                _refresh_edge(G, one_id, two_id)
+            return {one_id, two_id}, {edge_key(one_id, two_id)}
+        self._apply_logged(change)
+
+    def invite_saved(self, invite_id, sender_id, receiver_id, status):
+        def change(G):
+            _edge_data(G, sender_id, receiver_id)['invites'][invite_id] = status
+            _refresh_edge(G, sender_id, receiver_id)
+            return {sender_id, receiver_id}, {edge_key(sender_id, receiver_id)}
+        self._apply_logged(change)
+
+    def invite_deleted(self, invite_id, sender_id, receiver_id):
+        def change(G):
+            if G.has_edge(sender_id, receiver_id):
+                G.edges[sender_id, receiver_id]['invites'].pop(invite_id, None)
+                _refresh_edge(G, sender_id, receiver_id)
+            return {sender_id, receiver_id}, {edge_key(sender_id, receiver_id)}
+        self._apply_logged(change)
+
+
+study_graph = StudyGraphStore()
@@ -0,0 +1,71 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# network/instrumentation.py
+#
+# Timing spans and counters for the recommendation and graph code paths,
+# kept per process and cheap enough to leave on. Debug logging is sampled:
+# NETWORK_DEBUG_SAMPLE_RATE is the fraction of calls that log their details
+# (0 by default), and even then only when the logger is enabled for DEBUG,
+# so nothing gets formatted in production unless asked for.
+
+logger = logging.getLogger('network.instrumentation')
+
+_lock = threading.Lock()
+_counters = {}
+_spans = {}         # name -> {'count', 'total_ms', 'max_ms'}
+
+
+def sample_rate():
+    return getattr(settings, 'NETWORK_DEBUG_SAMPLE_RATE', 0.0)
+
+
+def sampled(log):
+    """True for the fraction of calls that should log debug detail to ``log``."""
+    rate = sample_rate()
+    if rate <= 0 or not log.isEnabledFor(logging.DEBUG):
+        return False
+    return rate >= 1 or random.random() < rate
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            stats = _spans.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        if sampled(logger):
+            logger.debug("%s took %.2f ms", name, elapsed_ms)
+
+
+def metrics_snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'spans': {
+                name: dict(stats, avg_ms=stats['total_ms'] / stats['count'])
+                for name, stats in _spans.items()
+            },
+        }
+
+
+def reset_metrics():
+    with _lock:
+        _counters.clear()
+        _spans.clear()
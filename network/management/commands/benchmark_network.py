@@ -0,0 +1,189 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from network.dashboard import build_dashboard_context, count_queries
+from network.graph_store import study_graph
+from network.models import UserProfile
+from network.rec_cache import recommendation_cache, user_stamp
+from network.suggestion_index import suggestion_index
+from network.synthetic import clear_campus, seed_campus
+from network.utils import build_study_network_graph, get_foaf_recommendations, get_suggested_study_buddies
+from network.versioning import bump_version
+from network.views import EGO_DEFAULT_MAX_NODES, EGO_DEFAULT_RADIUS, GRAPH_IMAGE_CACHE_KEY
+
+# Times the recommendation functions and the views built on them against
+# synthetic campuses of increasing size, in a throwaway test database, and
+# writes the results as JSON so runs can be compared across releases.
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class SampleFailed(Exception):
+    # A view that was too busy to answer (503); counted, not timed
+    pass
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the network app's recommendation functions and views on synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help="Comma separated campus sizes (number of users)")
+        parser.add_argument('--samples', type=int, default=10,
+                            help="Users to measure per size; each function runs once per user")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write JSON results here instead of stdout")
+        parser.add_argument('--skip', default='',
+                            help="Comma separated benchmark names to skip, e.g. graph_image")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database afterwards")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of integers")
+        skip = {name for name in options['skip'].split(',') if name}
+
+        setup_test_environment()
+        # Never benchmark against the real database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+            results = []
+            for size in sizes:
+                self.stderr.write(f"Seeding {size} users...")
+                clear_campus()
+                seed_campus(users=size, seed=options['seed'])
+                results.extend(self.run_size(size, options['samples'], skip))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = json.dumps({
+            'meta': {
+                'git_revision': _git_revision(),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'samples': options['samples'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(report)
+
+    def run_size(self, size, samples, skip):
+        # The busiest users first: they are the slow cases that matter
+        profiles = list(
+            UserProfile.objects.select_related('user')
+            .order_by('-available_weekdays_mask', 'id')[:samples]
+        )
+        client = Client()
+
+        def view(path):
+            def call(profile):
+                client.force_login(profile.user)
+                response = client.get(path)
+                if response.status_code == 503:
+                    raise SampleFailed(path)
+                if response.status_code != 200:
+                    raise CommandError(f"{path} answered {response.status_code}")
+            return call
+
+        def forget_graph_image(profile):
+            # This user's cached image and recommendations only; clearing the
+            # whole cache would also reset the version counters and make every
+            # sample rebuild the graph store and the suggestion index
+            cache.delete(GRAPH_IMAGE_CACHE_KEY.format(
+                user_id=profile.pk,
+                view=f'ego-{EGO_DEFAULT_RADIUS}-{EGO_DEFAULT_MAX_NODES}',
+                graph_version=study_graph.current_version(),
+                index_version=suggestion_index.current_version(),
+            ))
+            recommendation_cache.clear_local()
+            bump_version(user_stamp(profile.pk))
+
+        # (name, kind, call, warm up for every sampled user rather than once,
+        #  untimed step before each sample or None)
+        benchmarks = [
+            ('build_study_network_graph', 'function', lambda profile: build_study_network_graph(), False, None),
+            ('get_suggested_study_buddies', 'function', lambda profile: get_suggested_study_buddies(profile, limit=10), False, None),
+            ('get_foaf_recommendations', 'function', lambda profile: get_foaf_recommendations(profile, limit=12), False, None),
+            ('build_dashboard_context', 'function', lambda profile: build_dashboard_context(profile), False, None),
+            ('dashboard', 'view', view('/dashboard/'), False, None),
+            ('graph_image', 'view', view('/study_graph/image/?mode=ego'), False, forget_graph_image),
+            ('graph_image_cached', 'view', view('/study_graph/image/?mode=ego'), True, None),
+        ]
+
+        results = []
+        for name, kind, call, warm_all, prepare in benchmarks:
+            if name in skip:
+                continue
+            # Warm up so in-process stores (and caches, if asked) are built before timing
+            for profile in (profiles if warm_all else profiles[:1]):
+                try:
+                    call(profile)
+                except SampleFailed:
+                    pass
+            timings, queries, failures = [], [], 0
+            for profile in profiles:
+                if prepare is not None:
+                    prepare(profile)
+                with count_queries() as counter:
+                    start = time.perf_counter()
+                    try:
+                        call(profile)
+                    except SampleFailed:
+                        failures += 1
+                        continue
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(counter.count)
+            result = {
+                'size': size,
+                'name': name,
+                'kind': kind,
+                'runs': len(timings),
+                'failures': failures,
+                'median_ms': round(statistics.median(timings), 3) if timings else None,
+                'p95_ms': round(_percentile(timings, 0.95), 3) if timings else None,
+                'max_ms': round(max(timings), 3) if timings else None,
+                'queries_median': statistics.median(queries) if queries else None,
+                'queries_max': max(queries) if queries else None,
+            }
+            self.stderr.write(
+                f"  {name}: {result['median_ms']} ms, {result['queries_median']} queries"
+                + (f", {failures} failed" if failures else "")
+            )
+            results.append(result)
+        return results
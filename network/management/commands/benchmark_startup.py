@@ -0,0 +1,126 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from network.management.commands.benchmark_network import _git_revision, _percentile
+
+# Times cold starts in fresh interpreters: `manage.py check` (what every
+# management command and migration pays) and getting the WSGI application
+# ready to serve (settings, apps, URLconf and the views behind it). Also
+# lists which heavy libraries a worker has loaded by then; none of them
+# should be, they are imported when a graph, image or matrix needs them.
+
+HEAVY_MODULES = ['matplotlib', 'networkx', 'numpy', 'scipy', 'PIL']
+
+WSGI_READY_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from {wsgi_module} import application
+imported = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+ready = time.perf_counter()
+print(json.dumps({{
+    'wsgi_import': imported - start,
+    'wsgi_ready': ready - start,
+    'heavy_modules': sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Benchmark worker cold start: manage.py check and WSGI application import time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per measurement")
+        parser.add_argument('--top', type=int, default=15,
+                            help="Slowest packages to list, by import time (python -X importtime)")
+        parser.add_argument('--output', help="Write JSON results here instead of stdout")
+
+    def handle(self, *args, **options):
+        runs = max(options['runs'], 1)
+        wsgi_module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+        script = WSGI_READY_SCRIPT.format(wsgi_module=wsgi_module, heavy=HEAVY_MODULES)
+
+        samples = {'interpreter': [], 'check': [], 'wsgi_import': [], 'wsgi_ready': []}
+        heavy_modules = set()
+        for _ in range(runs):
+            samples['interpreter'].append(self._timed([sys.executable, '-c', 'pass'])[0])
+            samples['check'].append(self._timed([sys.executable, 'manage.py', 'check'])[0])
+            _, output = self._timed([sys.executable, '-c', script])
+            measured = json.loads(output.strip().splitlines()[-1])
+            samples['wsgi_import'].append(measured['wsgi_import'])
+            samples['wsgi_ready'].append(measured['wsgi_ready'])
+            heavy_modules.update(measured['heavy_modules'])
+
+        results = [
+            {
+                'name': name,
+                'runs': runs,
+                'median_ms': round(statistics.median(values) * 1000, 1),
+                'p95_ms': round(_percentile(values, 0.95) * 1000, 1),
+                'max_ms': round(max(values) * 1000, 1),
+            }
+            for name, values in samples.items()
+        ]
+        for result in results:
+            self.stderr.write(f"{result['name']:<12} median {result['median_ms']:>8.1f} ms")
+        if heavy_modules:
+            self.stderr.write(self.style.WARNING(f"Loaded at startup: {', '.join(sorted(heavy_modules))}"))
+
+        report = json.dumps({
+            'meta': {
+                'git_revision': _git_revision(),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'settings': settings.SETTINGS_MODULE,
+            },
+            'results': results,
+            'heavy_modules_at_startup': sorted(heavy_modules),
+            'slowest_imports': self._slowest_imports(script, options['top']),
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(report)
+
+    def _run(self, command, **kwargs):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, **kwargs)
+        if result.returncode != 0:
+            raise CommandError(f"{' '.join(command[:3])} failed:\n{result.stderr}")
+        return result
+
+    def _timed(self, command):
+        # Wall time including interpreter start, as a worker boot sees it
+        start = time.perf_counter()
+        result = self._run(command)
+        return time.perf_counter() - start, result.stdout
+
+    def _slowest_imports(self, script, top):
+        # Import time per top-level package (summed self time), from one more run
+        if top <= 0:
+            return []
+        stderr = self._run([sys.executable, '-X', 'importtime', '-c', script]).stderr
+        packages = {}
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            self_time, _, name = line[len('import time:'):].split('|')
+            if self_time.strip().isdigit():
+                package = name.strip().split('.')[0]
+                packages[package] = packages.get(package, 0) + int(self_time)
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [{'package': package, 'ms': round(us / 1000, 1)} for package, us in slowest]
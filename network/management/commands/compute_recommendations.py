@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from network.rec_batch import compute_recommendations, compute_recommendations_with_matrices, stale_profiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute suggestions and FOAF recommendations into the Recommendation table. "
+        "By default only users changed since the last run are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every user, not only stale ones")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Worker processes (default REC_BATCH_WORKERS or the CPU count; 1 runs inline)")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Users per worker task")
+        parser.add_argument('--engine', choices=['index', 'matrix'], default='index',
+                            help="index: rank users one by one in worker processes; "
+                                 "matrix: score everyone at once with sparse matrices (needs numpy and scipy)")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        items = stale_profiles(everyone=options['all'])
+        if not items:
+            self.stdout.write("Nothing to recompute")
+            return
+
+        if options['engine'] == 'matrix':
+            self.stdout.write(f"Scoring {len(items)} users with sparse matrices...")
+            try:
+                done = compute_recommendations_with_matrices(items)
+            except ImportError as exc:
+                raise CommandError(str(exc))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(f"Recomputed {done} users in {elapsed:.1f}s"))
+            return
+
+        chunk_size = max(options['chunk_size'], 1)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        workers = options['workers'] or getattr(settings, 'REC_BATCH_WORKERS', None) or os.cpu_count() or 1
+        workers = min(workers, len(chunks))
+        self.stdout.write(f"Recomputing {len(items)} users in {len(chunks)} chunks on {workers} worker(s)...")
+
+        done = 0
+        if workers <= 1:
+            for chunk in chunks:
+                done += compute_recommendations(chunk)
+        else:
+            # Spawned workers set Django up themselves and build their own
+            # suggestion index once, then take chunks until none are left
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            ) as executor:
+                futures = [executor.submit(compute_recommendations, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    done += future.result()
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"  {done}/{len(items)}")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {done} users in {elapsed:.1f}s"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from network.models import UserProfile
+from network.thumbnails import make_default_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Make the WebP derivatives of the default picture (run on deploy) and of "
+        "profile pictures that do not have them yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Remake them for every picture")
+
+    def handle(self, *args, **options):
+        try:
+            make_default_thumbnails()
+        except OSError as exc:
+            self.stderr.write(self.style.WARNING(f"No default picture thumbnails: {exc}"))
+        profiles = UserProfile.objects.exclude(profile_pic='').exclude(profile_pic__isnull=True).order_by('id')
+        made = 0
+        for profile in profiles.iterator(chunk_size=200):
+            if profile.update_thumbnails(force=options['force']):
+                made += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  {profile.profile_pic.name}")
+        self.stdout.write(self.style.SUCCESS(f"Updated thumbnails for {made} profiles"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from network.synthetic import DEFAULT_PREFIX, clear_campus, seed_campus
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic campus (users, courses, buddies, invites, messages, events)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--courses', type=int, default=None, help="Default: users / 20")
+        parser.add_argument('--courses-per-user', type=int, default=4)
+        parser.add_argument('--buddies-per-user', type=int, default=3)
+        parser.add_argument('--invites-per-user', type=int, default=2)
+        parser.add_argument('--messages-per-buddy', type=int, default=2)
+        parser.add_argument('--events', type=int, default=None, help="Default: users / 50")
+        parser.add_argument('--prefix', default=DEFAULT_PREFIX, help="Username prefix for generated users")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help="Delete an earlier synthetic campus first")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = clear_campus(options['prefix'])
+            self.stdout.write(f"Deleted {deleted} rows")
+
+        self.stdout.write(f"Seeding {options['users']} users...")
+        seed_campus(
+            users=options['users'],
+            courses=options['courses'],
+            courses_per_user=options['courses_per_user'],
+            buddies_per_user=options['buddies_per_user'],
+            invites_per_user=options['invites_per_user'],
+            messages_per_buddy=options['messages_per_buddy'],
+            events=options['events'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS("Done"))
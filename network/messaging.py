@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+
+from .models import DirectMessage, StudyBuddy, UserProfile
+from .pubsub import get_broker, user_channel
+
+# network/messaging.py
+
+CONVERSATION_PAGE_SIZE = 30
+
+
+def are_buddies(profile, other):
+    return StudyBuddy.objects.pair(profile.id, other.id).exists()
+
+
+def conversation_messages(profile, other):
+    return DirectMessage.objects.filter(
+        Q(sender=profile, receiver=other) | Q(sender=other, receiver=profile)
+    )
+
+
+def inbox_summary(user_profile):
+    # Every buddy with their last message, its time and how many messages
+    # from them are unread -- one statement, however many buddies there are.
+    latest = DirectMessage.objects.filter(
+        Q(sender=user_profile, receiver=OuterRef('pk'))
+        | Q(sender=OuterRef('pk'), receiver=user_profile)
+    ).order_by('-timestamp', '-id')
+    unread = DirectMessage.objects \
+        .filter(sender=OuterRef('pk'), receiver=user_profile, is_read=False) \
+        .order_by() \
+        .values('sender') \
+        .annotate(count=Count('id')) \
+        .values('count')
+
+    return UserProfile.objects \
+        .buddies_of(user_profile) \
+        .select_related('user') \
+        .annotate(
+            last_message=Subquery(latest.values('message')[:1]),
+            last_message_at=Subquery(latest.values('timestamp')[:1]),
+            last_message_sender_id=Subquery(latest.values('sender_id')[:1]),
+            unread_count=Coalesce(Subquery(unread), 0),
+        ) \
+        .order_by(F('last_message_at').desc(nulls_last=True), 'user__username')
+
+
+def encode_cursor(message):
+    return f"{message.timestamp.isoformat()}|{message.id}"
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, message_id = cursor.split('|')
+        timestamp = parse_datetime(timestamp)
+        message_id = int(message_id)
+    except (AttributeError, ValueError):
+        return None
+    if timestamp is None:
+        return None
+    return timestamp, message_id
+
+
+def conversation_page(profile, other, before=None, page_size=CONVERSATION_PAGE_SIZE):
+    """
+    One page of the conversation, oldest first, ending just before the
+    ``before`` cursor (or at the newest message). Returns
+    ``(messages, cursor for the previous page or None)``.
+    """
+    messages = conversation_messages(profile, other) \
+        .select_related('sender__user') \
+        .order_by('-timestamp', '-id')
+    position = decode_cursor(before) if before else None
+    if position is not None:
+        timestamp, message_id = position
+        messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+
+    page = list(messages[:page_size + 1])
+    older_cursor = encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+    page = page[:page_size]
+    page.reverse()
+    return page, older_cursor
+
+
+def mark_conversation_read(profile, other):
+    updated = DirectMessage.objects \
+        .filter(sender=other, receiver=profile, is_read=False) \
+        .update(is_read=True)
+    if updated:
+        # Read receipt for the other side
+        event = {'type': 'read', 'reader_id': profile.id, 'buddy_id': other.id}
+        transaction.on_commit(lambda: get_broker().publish(user_channel(other.id), event))
+    return updated
+
+
+# --- Live delivery (see network/pubsub.py) ---
+
+def message_event(message):
+    return {
+        'type': 'message',
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'sender': message.sender.user.username,
+        'message': message.message,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def publish_message(message):
+    # Both sides get it: the receiver, and the sender's other open tabs
+    event = message_event(message)
+    broker = get_broker()
+    broker.publish(user_channel(message.receiver_id), event)
+    broker.publish(user_channel(message.sender_id), event)
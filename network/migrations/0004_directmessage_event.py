@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0003_remove_studysession_participant_one_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='school',
+            field=models.CharField(choices=[('circle', 'Circle School'), ('square', 'Square School'), ('triangle', 'Triangle School'), ('rhombus', 'Rhombus School'), ('rectangle', 'Rectangle School')], max_length=100),
+        ),
+        migrations.CreateModel(
+            name='DirectMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('is_read', models.BooleanField(default=False)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_messages', to='network.userprofile')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_messages', to='network.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('target_school', models.CharField(blank=True, choices=[('circle', 'Circle School'), ('square', 'Square School'), ('triangle', 'Triangle School'), ('rhombus', 'Rhombus School'), ('rectangle', 'Rectangle School')], max_length=100, null=True)),
+                ('target_major', models.CharField(blank=True, max_length=100, null=True)),
+                ('organizer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='organized_events', to='network.userprofile')),
+            ],
+            options={
+                'ordering': ['-date', '-time'],
+            },
+        ),
+    ]
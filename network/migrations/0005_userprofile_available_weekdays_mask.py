@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+WEEKDAY_CODES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def backfill_weekdays_mask(apps, schema_editor):
+    UserProfile = apps.get_model('network', 'UserProfile')
+    batch = []
+    for profile in UserProfile.objects.only('id', 'available_weekdays').iterator(chunk_size=1000):
+        profile.available_weekdays_mask = sum(
+            1 << bit for bit, code in enumerate(WEEKDAY_CODES)
+            if code in (profile.available_weekdays or [])
+        )
+        batch.append(profile)
+        if len(batch) >= 1000:
+            UserProfile.objects.bulk_update(batch, ['available_weekdays_mask'])
+            batch = []
+    if batch:
+        UserProfile.objects.bulk_update(batch, ['available_weekdays_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0004_directmessage_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='available_weekdays_mask',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_weekdays_mask, migrations.RunPython.noop),
+    ]
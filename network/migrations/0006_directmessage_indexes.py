@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0005_userprofile_available_weekdays_mask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='directmessage',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='dm_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='directmessage',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', 'sender'], name='dm_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_event_audiences(apps, schema_editor):
+    Event = apps.get_model('network', 'Event')
+    EventAudience = apps.get_model('network', 'EventAudience')
+    batch = []
+    for event in Event.objects.only('id', 'date', 'time', 'target_school', 'target_major').iterator(chunk_size=1000):
+        batch.append(EventAudience(
+            event_id=event.id,
+            school=event.target_school or '',
+            major=event.target_major or '',
+            date=event.date,
+            time=event.time,
+        ))
+        if len(batch) >= 1000:
+            EventAudience.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        EventAudience.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0006_directmessage_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventAudience',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('school', models.CharField(blank=True, default='', max_length=100)),
+                ('major', models.CharField(blank=True, default='', max_length=100)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date', 'time', 'id'], name='event_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['school', 'major'], name='profile_school_major_idx'),
+        ),
+        migrations.AddField(
+            model_name='eventaudience',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audiences', to='network.event'),
+        ),
+        migrations.AddIndex(
+            model_name='eventaudience',
+            index=models.Index(fields=['school', 'major', 'date', 'time', 'event'], name='event_audience_feed_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventaudience',
+            unique_together={('event', 'school', 'major')},
+        ),
+        migrations.RunPython(backfill_event_audiences, migrations.RunPython.noop),
+    ]
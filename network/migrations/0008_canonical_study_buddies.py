@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:30
+
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Greatest, Least
+
+
+def dedupe_study_buddies(apps, schema_editor):
+    StudyBuddy = apps.get_model('network', 'StudyBuddy')
+
+    # Nobody is their own buddy
+    StudyBuddy.objects.filter(participant_one=F('participant_two')).delete()
+
+    # Keep the oldest row of every unordered pair (A-B and B-A are one pair)
+    pairs = StudyBuddy.objects.annotate(
+        low=Least('participant_one', 'participant_two'),
+        high=Greatest('participant_one', 'participant_two'),
+    )
+    older = pairs.filter(low=OuterRef('low'), high=OuterRef('high'), id__lt=OuterRef('id'))
+    pairs.filter(Exists(older)).delete()
+
+    # Then store the survivors lower id first
+    StudyBuddy.objects.filter(participant_one__gt=F('participant_two')).update(
+        participant_one=F('participant_two'),
+        participant_two=F('participant_one'),
+    )
+    # Run the deferred foreign key checks now; Postgres will not add the
+    # constraint below while they are pending in this transaction
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0007_event_audience'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_study_buddies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studybuddy',
+            constraint=models.CheckConstraint(condition=models.Q(('participant_one__lt', models.F('participant_two'))), name='studybuddy_canonical_order'),
+        ),
+    ]
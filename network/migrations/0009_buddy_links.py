@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_buddy_links(apps, schema_editor):
+    StudyBuddy = apps.get_model('network', 'StudyBuddy')
+    BuddyLink = apps.get_model('network', 'BuddyLink')
+    batch = []
+    pairs = StudyBuddy.objects.values_list('id', 'participant_one_id', 'participant_two_id')
+    for pair_id, one_id, two_id in pairs.iterator(chunk_size=1000):
+        batch.append(BuddyLink(owner_id=one_id, buddy_id=two_id, pair_id=pair_id))
+        batch.append(BuddyLink(owner_id=two_id, buddy_id=one_id, pair_id=pair_id))
+        if len(batch) >= 2000:
+            BuddyLink.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        BuddyLink.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0008_canonical_study_buddies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuddyLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('buddy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_buddy_links', to='network.userprofile')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buddy_links', to='network.userprofile')),
+                ('pair', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='links', to='network.studybuddy')),
+            ],
+            options={
+                'unique_together': {('owner', 'buddy')},
+            },
+        ),
+        migrations.RunPython(backfill_buddy_links, migrations.RunPython.noop),
+    ]
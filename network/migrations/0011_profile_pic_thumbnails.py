@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0010_precomputed_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_pic_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:53
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0011_profile_pic_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('code'), name='text_pattern_ops'), name='course_code_prefix_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0012_course_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleCourse',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='network.course')),
+                ('marked_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recommendationstate',
+            name='computed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
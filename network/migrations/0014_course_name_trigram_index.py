@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.text
+from django.db import migrations
+
+
+# Needs the pg_trgm extension on the database server (postgresql-contrib on
+# most distributions), and a role allowed to create it if it isn't enabled
+# yet. Kept apart from 0012 so a server without it still gets the code
+# prefix index.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0013_recommendation_staleness'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='course_name_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0014_course_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='available_weekdays_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
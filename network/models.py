@@ -1,11 +1,24 @@
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Upper
+from django.dispatch import Signal
 
 class Course(models.Model):
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=20, unique=True)
 
+    class Meta:
+        indexes = [
+            # Course search (network/courses.py): code prefix, and name
+            # substring through pg_trgm, both case-insensitive. The trigram
+            # index needs the pg_trgm extension (migration 0014)
+            models.Index(OpClass(Upper('code'), name='text_pattern_ops'), name='course_code_prefix_idx'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='course_name_trgm_idx'),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.name}"
 
@@ -19,6 +32,21 @@ WEEKDAY_CHOICES = [
     ('sun', 'Sunday'),
 ]
 
+# Availability is mirrored as a 7-bit mask (Monday = bit 0) so two profiles
+# can be matched with a single bitwise AND, in Python or in SQL.
+WEEKDAY_BITS = {code: 1 << bit for bit, (code, _) in enumerate(WEEKDAY_CHOICES)}
+
+
+def weekdays_to_mask(weekdays):
+    mask = 0
+    for day in weekdays or []:
+        mask |= WEEKDAY_BITS[day]
+    return mask
+
+
+def mask_to_weekdays(mask):
+    return [code for code, bit in WEEKDAY_BITS.items() if mask & bit]
+
 SCHOOL_CHOICES = [
     ('circle', 'Circle School'),
     ('square', 'Square School'),
@@ -27,6 +55,18 @@ SCHOOL_CHOICES = [
     ('rectangle', 'Rectangle School'),
 ]
 
+# Sent once per UserProfile.set_courses() call that changed anything, with
+# ``profile_id``, ``added_ids`` and ``removed_ids`` (course ids). set_courses()
+# writes in bulk, so no per-row UserCourse signals fire for it.
+enrollment_changed = Signal()
+
+
+class UserProfileQuerySet(models.QuerySet):
+    def buddies_of(self, profile):
+        # One index range on BuddyLink(owner, buddy)
+        return self.filter(incoming_buddy_links__owner=profile)
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     school = models.CharField(max_length=100, choices=SCHOOL_CHOICES)
@@ -52,13 +92,97 @@ class UserProfile(models.Model):
         blank=True,
         help_text="Select the days you're available to study on."
     )
+    # Kept in sync with available_weekdays by save()
+    available_weekdays_mask = models.PositiveSmallIntegerField(default=0, editable=False)
 
     profile_pic = models.ImageField(upload_to='profile_pics', null=True, blank=True)
+    # {size: storage name} of the WebP derivatives (see network/thumbnails.py),
+    # plus 'source': the profile_pic they were made from
+    profile_pic_thumbnails = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(null=True, blank=True)
 
+    objects = UserProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Event audiences are looked up by school and major
+            models.Index(fields=['school', 'major'], name='profile_school_major_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
 
+    def save(self, *args, **kwargs):
+        self.available_weekdays_mask = weekdays_to_mask(self.available_weekdays)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'available_weekdays' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'available_weekdays_mask'}
+        super().save(*args, **kwargs)
+        if (update_fields is None or 'profile_pic' in update_fields) and self.thumbnails_outdated():
+            if self.profile_pic:
+                # Made in a render worker once the picture is committed
+                from .thumbnails import queue_thumbnails
+                profile_id, source = self.pk, self.profile_pic.name
+                transaction.on_commit(lambda: queue_thumbnails(profile_id, source))
+            else:
+                self.update_thumbnails()
+
+    def thumbnails_outdated(self):
+        source = self.profile_pic.name if self.profile_pic else ''
+        return self.profile_pic_thumbnails.get('source', '') != source
+
+    def update_thumbnails(self, force=False):
+        # Remake the derivatives here and now if profile_pic changed since
+        # they were made (generate_thumbnails). Stored with update() so
+        # saving them does not fire post_save again; the page stamps are
+        # touched here instead.
+        from .conditional import profile_pages_changed
+        from .thumbnails import make_thumbnails
+
+        source = self.profile_pic.name if self.profile_pic else ''
+        if not force and not self.thumbnails_outdated():
+            return False
+        thumbnails = {}
+        if self.profile_pic:
+            try:
+                thumbnails = make_thumbnails(self.profile_pic)
+            except OSError:
+                thumbnails = {}  # the file is gone; keep serving the original URL
+        self.profile_pic_thumbnails = {**thumbnails, 'source': source} if source else {}
+        UserProfile.objects.filter(pk=self.pk).update(profile_pic_thumbnails=self.profile_pic_thumbnails)
+        profile_id = self.pk
+        transaction.on_commit(lambda: profile_pages_changed(profile_id))
+        return True
+
+    def set_courses(self, courses):
+        """
+        Make ``courses`` (Course objects or ids) exactly this profile's
+        enrollments with one DELETE and one INSERT, in a transaction.
+        Returns ``(added_ids, removed_ids)``.
+        """
+        course_ids = sorted({getattr(course, 'pk', course) for course in courses})
+        table = UserCourse._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE user_profile_id = %s AND NOT (course_id = ANY(%s)) "
+                "RETURNING course_id",
+                [self.pk, course_ids],
+            )
+            removed_ids = {course_id for course_id, in cursor.fetchall()}
+            # Existing enrollments are left alone; RETURNING gives only the new ones
+            cursor.execute(
+                f"INSERT INTO {table} (user_profile_id, course_id) "
+                "SELECT %s, UNNEST(%s::bigint[]) ON CONFLICT DO NOTHING RETURNING course_id",
+                [self.pk, course_ids],
+            )
+            added_ids = {course_id for course_id, in cursor.fetchall()}
+            if added_ids or removed_ids:
+                enrollment_changed.send(
+                    sender=UserProfile, profile_id=self.pk,
+                    added_ids=added_ids, removed_ids=removed_ids,
+                )
+        return added_ids, removed_ids
+
     @property
     def profile_pic_url(self):
         if self.profile_pic and hasattr(self.profile_pic, 'url'):
@@ -92,13 +216,81 @@ class StudyBuddyInvite(models.Model):
     class Meta:
         unique_together = ('sender', 'receiver')
 
+    def accept(self):
+        """
+        Accept the invite and create the buddy pair, in one transaction with
+        the invite row locked, so concurrent or repeated accepts make one pair.
+        Returns the StudyBuddy.
+        """
+        with transaction.atomic():
+            invite = StudyBuddyInvite.objects.select_for_update().get(pk=self.pk)
+            if invite.status != 'accepted':
+                invite.status = 'accepted'
+                invite.save(update_fields=['status'])
+            self.status = invite.status
+            buddy, _ = StudyBuddy.objects.get_or_create_pair(invite.sender_id, invite.receiver_id)
+        return buddy
+
+
+def canonical_pair(profile_id, other_id):
+    # Buddy pairs are stored lower id first
+    return (profile_id, other_id) if profile_id < other_id else (other_id, profile_id)
+
+
+class StudyBuddyQuerySet(models.QuerySet):
+    def pair(self, profile_id, other_id):
+        one_id, two_id = canonical_pair(profile_id, other_id)
+        return self.filter(participant_one_id=one_id, participant_two_id=two_id)
+
+    def get_or_create_pair(self, profile_id, other_id):
+        one_id, two_id = canonical_pair(profile_id, other_id)
+        return self.get_or_create(participant_one_id=one_id, participant_two_id=two_id)
+
 
 class StudyBuddy(models.Model):
+    # Always participant_one.id < participant_two.id (see save())
     participant_one = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='participant_one')
     participant_two = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='participant_two')
 
+    objects = StudyBuddyQuerySet.as_manager()
+
     class Meta:
         unique_together = ('participant_one', 'participant_two')
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(participant_one__lt=F('participant_two')),
+                name='studybuddy_canonical_order',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.participant_one_id, self.participant_two_id = canonical_pair(
+            self.participant_one_id, self.participant_two_id)
+        super().save(*args, **kwargs)
+
+
+class BuddyLink(models.Model):
+    # One row per direction of every StudyBuddy pair, so "my buddies" is a
+    # lookup on owner instead of an OR across both participants. Written by
+    # network/signals.py when a pair is created and deleted with it.
+    owner = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='buddy_links')
+    buddy = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='incoming_buddy_links')
+    pair = models.ForeignKey(StudyBuddy, on_delete=models.CASCADE, related_name='links')
+
+    class Meta:
+        unique_together = ('owner', 'buddy')
+
+    def __str__(self):
+        return f"{self.owner_id} -> {self.buddy_id}"
+
+    @classmethod
+    def for_pairs(cls, pairs):
+        # Both directions of each StudyBuddy, ready for bulk_create
+        links = []
+        for pair in pairs:
+            links.append(cls(owner_id=pair.participant_one_id, buddy_id=pair.participant_two_id, pair_id=pair.id))
+            links.append(cls(owner_id=pair.participant_two_id, buddy_id=pair.participant_one_id, pair_id=pair.id))
+        return links
 
 class DirectMessage(models.Model):
     sender = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='sent_messages')
@@ -107,6 +299,14 @@ class DirectMessage(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)  # Optional
 
+    class Meta:
+        indexes = [
+            # Conversations are read newest first, one direction per index scan
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='dm_conversation_idx'),
+            # Unread counts only ever look at unread rows
+            models.Index(fields=['receiver', 'sender'], condition=Q(is_read=False), name='dm_unread_idx'),
+        ]
+
     def __str__(self):
         return f"From {self.sender} to {self.receiver} at {self.timestamp}"
 
@@ -123,6 +323,96 @@ class Event(models.Model):
 
     class Meta:
         ordering = ['-date', '-time']
+        indexes = [
+            models.Index(fields=['date', 'time', 'id'], name='event_date_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} by {self.organizer.user.username}"
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.sync_audience()
+
+    def sync_audience(self):
+        # One audience row per event; '' stands for "any school/major"
+        school, major = self.target_school or '', self.target_major or ''
+        EventAudience.objects.filter(event=self).exclude(school=school, major=major).delete()
+        EventAudience.objects.update_or_create(
+            event=self, school=school, major=major,
+            defaults={'date': self.date, 'time': self.time},
+        )
+
+
+class EventAudience(models.Model):
+    # Who an event is for, with its date and time copied over so the feed for
+    # a school/major pair is a single index range scan. Maintained by
+    # Event.save(); an empty school or major matches everyone.
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='audiences')
+    school = models.CharField(max_length=100, blank=True, default='')
+    major = models.CharField(max_length=100, blank=True, default='')
+    date = models.DateField()
+    time = models.TimeField()
+
+    class Meta:
+        unique_together = ('event', 'school', 'major')
+        indexes = [
+            models.Index(fields=['school', 'major', 'date', 'time', 'event'], name='event_audience_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} for {self.school or 'any school'} / {self.major or 'any major'}"
+
+
+class RecommendationState(models.Model):
+    # Bookkeeping for the batch job (network/rec_batch.py). ``version`` goes
+    # up whenever something the user's recommendations depend on changes;
+    # their Recommendation rows are fresh while computed_version == version.
+    user_profile = models.OneToOneField(
+        UserProfile, on_delete=models.CASCADE, primary_key=True, related_name='recommendation_state')
+    version = models.PositiveIntegerField(default=0)
+    computed_version = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(null=True, blank=True)  # None until first computed
+
+    def __str__(self):
+        return f"{self.user_profile_id} v{self.computed_version}/{self.version}"
+
+    @property
+    def is_fresh(self):
+        return self.computed_version == self.version
+
+
+class StaleCourse(models.Model):
+    # A course whose enrollees' recommendations changed since the batch job
+    # last ran. One row per course instead of an UPDATE of every enrollee's
+    # RecommendationState in the request; the job bumps the enrollees and
+    # deletes the row, and readers treat the enrollees as stale meanwhile.
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    marked_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.course_id} stale since {self.marked_at}"
+
+
+class Recommendation(models.Model):
+    # Precomputed by the compute_recommendations command
+    KIND_CHOICES = [
+        ('suggestion', 'Suggestion'),
+        ('foaf', 'Friend of a friend'),
+    ]
+
+    user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='recommendations')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    candidate = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(default=0)
+    shared_course_ids = ArrayField(models.BigIntegerField(), default=list, blank=True)  # suggestions
+    shared_weekdays_mask = models.PositiveSmallIntegerField(default=0)  # suggestions
+    mutual_ids = ArrayField(models.BigIntegerField(), default=list, blank=True)  # FOAF
+
+    class Meta:
+        unique_together = ('user_profile', 'kind', 'rank')
 
     def __str__(self):
-        return f"{self.title} by {self.organizer.user.username}"
\ No newline at end of file
+        return f"{self.kind} #{self.rank} for {self.user_profile_id}: {self.candidate_id}"
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# network/pubsub.py
+#
+# Small publish/subscribe layer behind the live message stream. Publishing
+# is synchronous and safe from any thread (views, signal handlers);
+# subscribing happens inside async views. The backend is chosen with the
+# NETWORK_PUBSUB_BACKEND setting; InMemoryBroker only reaches subscribers in
+# the same process, which is enough for a single node and for tests.
+
+DEFAULT_BACKEND = 'network.pubsub.InMemoryBroker'
+
+
+def user_channel(profile_id):
+    return f'user:{profile_id}'
+
+
+class Broker:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Return a Subscription; must be called from a running event loop."""
+        raise NotImplementedError
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop. A client that stopped reading loses
+        # its oldest events rather than holding memory forever.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Next event, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker(Broker):
+    def __init__(self, queue_size=100):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self.queue_size = queue_size
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Subscriber's loop already closed
+                subscription.close()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            backend = getattr(settings, 'NETWORK_PUBSUB_BACKEND', DEFAULT_BACKEND)
+            _broker = import_string(backend)()
+        return _broker
@@ -0,0 +1,201 @@
+from django.db import transaction
+from django.db.models import Exists, F
+from django.utils import timezone
+
+from .models import Recommendation, RecommendationState, StaleCourse, UserCourse, UserProfile
+from .utils import (
+    get_foaf_recommendations, get_suggested_study_buddies, hydrate_foaf_recommendations,
+    hydrate_suggestions, rank_foaf_candidates, rank_suggestions,
+)
+
+# network/rec_batch.py
+#
+# Precomputed recommendations. The compute_recommendations command ranks
+# suggestions and FOAFs for many users at once (in worker processes) and
+# stores them as Recommendation rows; requests read those rows while the
+# user's RecommendationState says they are fresh, and compute live
+# otherwise. The same changes that invalidate network/rec_cache.py mark
+# users stale here, so incremental runs only redo those users.
+
+PRECOMPUTED_SUGGESTIONS = 50
+PRECOMPUTED_FOAF = 24
+
+
+# --- Staleness, called from network/rec_cache.py ---
+
+def mark_users_stale(profile_ids):
+    # Users without a state row have nothing stored to go stale
+    RecommendationState.objects.filter(user_profile_id__in=profile_ids).update(version=F('version') + 1)
+
+
+def mark_courses_stale(course_ids):
+    # Everyone enrolled in any of the courses, recorded per course; the
+    # batch job expands it (expand_stale_courses)
+    now = timezone.now()
+    StaleCourse.objects.bulk_create(
+        [StaleCourse(course_id=course_id, marked_at=now) for course_id in sorted(course_ids)],
+        update_conflicts=True,
+        unique_fields=['course'],
+        update_fields=['marked_at'],
+    )
+
+
+# --- Batch computation ---
+
+def expand_stale_courses():
+    """Mark the enrollees of every StaleCourse stale. Returns the number of courses."""
+    with transaction.atomic():
+        course_ids = list(StaleCourse.objects.select_for_update().values_list('course_id', flat=True))
+        if course_ids:
+            RecommendationState.objects \
+                .filter(user_profile__usercourse__course_id__in=course_ids) \
+                .update(version=F('version') + 1)
+            StaleCourse.objects.filter(course_id__in=course_ids).delete()
+    return len(course_ids)
+
+
+def stale_profiles(everyone=False):
+    """[(profile_id, version), ...] for users never computed or changed since."""
+    expand_stale_courses()
+    # Users seen for the first time get a state row now, so a change during
+    # the run has a version to bump (version 1 > computed_version 0: stale)
+    missing = UserProfile.objects.filter(recommendation_state__isnull=True).values_list('id', flat=True)
+    RecommendationState.objects.bulk_create(
+        [RecommendationState(user_profile_id=profile_id, version=1) for profile_id in missing],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    states = RecommendationState.objects.order_by('user_profile_id')
+    if not everyone:
+        states = states.filter(computed_version__lt=F('version'))
+    return list(states.values_list('user_profile_id', 'version'))
+
+
+def store_recommendations(items, suggestions, foafs):
+    """
+    Replace the stored recommendations of ``[(profile_id, version), ...]``
+    (versions as read before ranking) with ``suggestions`` and ``foafs``,
+    both {profile_id: ranking} as returned by rank_suggestions() and
+    rank_foaf_candidates(). Returns the number of users stored.
+    """
+    profile_ids = set(UserProfile.objects.filter(id__in=[profile_id for profile_id, _ in items]).values_list('id', flat=True))
+    rows = []
+    for profile_id in sorted(profile_ids):
+        for rank, (candidate_id, score, shared_course_ids, shared_mask) in enumerate(suggestions.get(profile_id, [])):
+            rows.append(Recommendation(
+                user_profile_id=profile_id, kind='suggestion', rank=rank, candidate_id=candidate_id,
+                score=score, shared_course_ids=sorted(shared_course_ids), shared_weekdays_mask=shared_mask,
+            ))
+        for rank, (foaf_id, mutual_ids) in enumerate(foafs.get(profile_id, [])):
+            rows.append(Recommendation(
+                user_profile_id=profile_id, kind='foaf', rank=rank, candidate_id=foaf_id,
+                score=len(mutual_ids), mutual_ids=mutual_ids,
+            ))
+
+    now = timezone.now()
+    with transaction.atomic():
+        Recommendation.objects.filter(user_profile_id__in=profile_ids).delete()
+        Recommendation.objects.bulk_create(rows, batch_size=1000)
+        # A user changed while we were ranking keeps version > computed_version
+        RecommendationState.objects.bulk_create(
+            [
+                RecommendationState(
+                    user_profile_id=profile_id, version=version,
+                    computed_version=version, computed_at=now,
+                )
+                for profile_id, version in items if profile_id in profile_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['user_profile'],
+            update_fields=['computed_version', 'computed_at'],
+        )
+    return len(profile_ids)
+
+
+def compute_recommendations(items):
+    """
+    Rank users one by one with the live code paths and store the results.
+    Runs in the worker processes.
+    """
+    profiles = UserProfile.objects.in_bulk([profile_id for profile_id, _ in items])
+    suggestions, foafs = {}, {}
+    for profile_id, profile in profiles.items():
+        suggestions[profile_id] = rank_suggestions(profile, limit=PRECOMPUTED_SUGGESTIONS)
+        foafs[profile_id] = rank_foaf_candidates(profile, limit=PRECOMPUTED_FOAF)
+    return store_recommendations(items, suggestions, foafs)
+
+
+def compute_recommendations_with_matrices(items, chunk_size=1000, progress=None):
+    """
+    Rank every user in ``items`` with the sparse matrix engine
+    (network/scoring.py) in one process, storing in chunks.
+    """
+    from .scoring import CampusMatrices, score_foaf, score_suggestions
+
+    matrices = CampusMatrices()
+    done = 0
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        profile_ids = [profile_id for profile_id, _ in chunk]
+        done += store_recommendations(
+            chunk,
+            score_suggestions(matrices, profile_ids, PRECOMPUTED_SUGGESTIONS),
+            score_foaf(matrices, profile_ids, PRECOMPUTED_FOAF),
+        )
+        if progress is not None:
+            progress(done)
+    return done
+
+
+# --- Reading ---
+
+def _fresh_rows(user_profile, kind):
+    # Nothing when the user, or a course they take (until the batch job
+    # expands it), changed since the rows were computed
+    stale_course = UserCourse.objects.filter(
+        user_profile=user_profile,
+        course_id__in=StaleCourse.objects.values('course_id'),
+    )
+    return Recommendation.objects \
+        .filter(
+            ~Exists(stale_course),
+            user_profile=user_profile, kind=kind,
+            user_profile__recommendation_state__computed_version=F('user_profile__recommendation_state__version'),
+        ) \
+        .order_by('rank')
+
+
+def precomputed_suggestions(user_profile, limit, offset=0):
+    # None when the rows are stale, missing or may not cover the page
+    if limit is None:
+        return None
+    rows = list(_fresh_rows(user_profile, 'suggestion')[offset:offset + limit])
+    if not rows or (len(rows) < limit and offset + limit > PRECOMPUTED_SUGGESTIONS):
+        return None
+    return [
+        (row.candidate_id, row.score, set(row.shared_course_ids), row.shared_weekdays_mask)
+        for row in rows
+    ]
+
+
+def precomputed_foaf(user_profile, limit):
+    if limit is None or limit > PRECOMPUTED_FOAF:
+        return None
+    rows = list(_fresh_rows(user_profile, 'foaf')[:limit])
+    if not rows:
+        return None
+    return [(row.candidate_id, list(row.mutual_ids)) for row in rows]
+
+
+def suggestions_for(user_profile, limit=None, offset=0):
+    ranked = precomputed_suggestions(user_profile, limit, offset)
+    if ranked is None:
+        return get_suggested_study_buddies(user_profile, limit=limit, offset=offset)
+    return hydrate_suggestions(ranked)
+
+
+def foaf_recommendations_for(user_profile, limit=None):
+    ranked = precomputed_foaf(user_profile, limit)
+    if ranked is None:
+        return get_foaf_recommendations(user_profile, limit=limit)
+    return hydrate_foaf_recommendations(user_profile, ranked)
@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import incr
+from .models import BuddyLink
+from .rec_batch import foaf_recommendations_for, mark_courses_stale, mark_users_stale, suggestions_for
+from .suggestion_index import suggestion_index
+from .versioning import bump_version, get_versions
+
+# network/rec_cache.py
+#
+# Per-user cache of suggestions and FOAF recommendations: a small LRU in
+# this process in front of the Django cache. Entries are never deleted;
+# their keys carry version stamps, and network/signals.py bumps the stamps
+# of exactly the users (and courses) a change can affect:
+#
+#   rec:user:<id>     the user's own profile, courses, invites or buddies,
+#                     or a buddy's buddies (their FOAFs)
+#   rec:course:<id>   anyone enrolled in the course changed their courses,
+#                     days, style or school (their course-mates' suggestions)
+#
+# Details of *other* users shown alongside a recommendation (usernames, a
+# FOAF's full course list) can lag by up to REC_CACHE_TIMEOUT.
+#
+# On a miss, precomputed rows (network/rec_batch.py) are used when fresh;
+# the same invalidations mark them stale.
+
+REC_CACHE_KEY = 'network:recs:{kind}:{user_id}:{params}:{stamp}'
+
+
+def user_stamp(profile_id):
+    return f'rec:user:{profile_id}'
+
+
+def course_stamp(course_id):
+    return f'rec:course:{course_id}'
+
+
+class RecommendationCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+
+    def _key(self, kind, user_profile, params):
+        names = [user_stamp(user_profile.id)]
+        names += [course_stamp(course_id) for course_id in sorted(suggestion_index.courses_of(user_profile.id))]
+        versions = get_versions(names)
+        stamp = '-'.join(str(versions[name]) for name in names)
+        return REC_CACHE_KEY.format(
+            kind=kind, user_id=user_profile.id,
+            params='-'.join(str(p) for p in params), stamp=stamp,
+        )
+
+    def _lru_get(self, key):
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+            return value
+
+    def _lru_set(self, key, value):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > getattr(settings, 'REC_CACHE_LRU_SIZE', 1024):
+                self._lru.popitem(last=False)
+
+    def get_or_compute(self, kind, user_profile, params, compute):
+        key = self._key(kind, user_profile, params)
+        value = self._lru_get(key)
+        if value is not None:
+            incr('rec_cache.lru_hits')
+            return value
+
+        value = cache.get(key)
+        if value is not None:
+            incr('rec_cache.shared_hits')
+        else:
+            incr('rec_cache.misses')
+            value = compute()
+            cache.set(key, value, getattr(settings, 'REC_CACHE_TIMEOUT', 600))
+        self._lru_set(key, value)
+        return value
+
+    def clear_local(self):
+        with self._lock:
+            self._lru.clear()
+
+    # --- Invalidation, called from network/signals.py ---
+
+    def users_changed(self, profile_ids):
+        profile_ids = set(profile_ids)
+        for profile_id in profile_ids:
+            bump_version(user_stamp(profile_id))
+        mark_users_stale(profile_ids)
+
+    def courses_changed(self, course_ids):
+        course_ids = set(course_ids)
+        if not course_ids:
+            return
+        for course_id in course_ids:
+            bump_version(course_stamp(course_id))
+        mark_courses_stale(course_ids)
+
+    def profile_changed(self, profile_id):
+        # Their own recommendations, and every course-mate's suggestions
+        self.users_changed([profile_id])
+        self.courses_changed(suggestion_index.courses_of(profile_id))
+
+    def enrollments_changed(self, profile_id, course_ids):
+        self.users_changed([profile_id])
+        self.courses_changed(course_ids)
+
+    def buddies_changed(self, one_id, two_id):
+        # Both sides, and everyone whose FOAFs run through either of them
+        neighbours = BuddyLink.objects.filter(owner_id__in=[one_id, two_id]).values_list('buddy_id', flat=True)
+        self.users_changed([one_id, two_id, *neighbours])
+
+
+recommendation_cache = RecommendationCache()
+
+
+def cached_suggestions(user_profile, limit=None, offset=0):
+    return recommendation_cache.get_or_compute(
+        'suggestions', user_profile, (limit, offset),
+        lambda: suggestions_for(user_profile, limit=limit, offset=offset),
+    )
+
+
+def cached_foaf_recommendations(user_profile, limit=None):
+    return recommendation_cache.get_or_compute(
+        'foaf', user_profile, (limit,),
+        lambda: foaf_recommendations_for(user_profile, limit=limit),
+    )
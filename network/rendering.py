@@ -0,0 +1,182 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+# network/rendering.py
+#
+# Graph images are laid out and rasterised in a small pool of worker
+# processes, using matplotlib's object-oriented Figure/Agg API (no pyplot
+# global state). Jobs are plain data so the workers never touch Django.
+# Concurrent requests for the same image share one job.
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_SEED = 42
+
+USER_COLOR = '#FFD600'            # Gold for user
+BUDDY_COLOR = '#1976d2'           # Blue for buddies
+RECOMMENDATION_COLOR = '#FFAB40'  # Faint orange for recommendations
+OTHER_COLOR = 'lightgray'
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def graph_render_job(G, user_node=None, buddy_nodes=None, recommendation_nodes=None,
+                     pos=None, initial_pos=None, iterations=50):
+    """Everything a worker needs to draw ``G``, as plain picklable data."""
+    buddy_nodes = {str(b) for b in buddy_nodes or []}
+    recommendation_nodes = {str(r) for r in recommendation_nodes or []}
+
+    nodes = []
+    for n, data in G.nodes(data=True):
+        if str(n) == str(user_node):
+            color = USER_COLOR
+        elif str(n) in buddy_nodes:
+            color = BUDDY_COLOR
+        elif str(n) in recommendation_nodes:
+            color = RECOMMENDATION_COLOR
+        else:
+            color = OTHER_COLOR
+        nodes.append((n, data.get('label', str(n)), color))
+
+    edges = [
+        (u, v, 'green' if d.get('type') == 'session' else 'blue')
+        for u, v, d in G.edges(data=True)
+    ]
+    return {
+        'nodes': nodes,
+        'edges': edges,
+        'pos': pos,
+        'initial_pos': initial_pos,
+        'iterations': iterations,
+    }
+
+
+def init_render_worker():
+    # Headless: nx.draw() imports pyplot, which would otherwise probe for a
+    # GUI backend. Importing here also keeps it out of the first job's time.
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    import networkx
+
+
+def render_graph_job(job):
+    """Runs in a worker process. Returns ``(png_bytes, positions)``."""
+    import networkx as nx
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    G = nx.Graph()
+    for n, label, color in job['nodes']:
+        G.add_node(n, label=label, color=color)
+    for u, v, color in job['edges']:
+        G.add_edge(u, v, color=color)
+
+    pos = job['pos']
+    if pos is None:
+        pos = nx.spring_layout(
+            G, k=0.8, pos=job['initial_pos'] or None,
+            iterations=job['iterations'], seed=LAYOUT_SEED,
+        )
+        pos = {n: (float(x), float(y)) for n, (x, y) in pos.items()}
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    nx.draw(
+        G, pos=pos, ax=ax,
+        with_labels=True, labels=nx.get_node_attributes(G, 'label'),
+        edge_color=[d['color'] for _, _, d in G.edges(data=True)],
+        node_size=800,
+        node_color=[d['color'] for _, d in G.nodes(data=True)],
+        linewidths=2,
+        edgecolors='black'
+    )
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue(), pos
+
+
+class GraphRenderPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._jobs = {}
+
+    def _get_executor(self):
+        # Caller must hold self._lock. Spawned (not forked) workers, so a
+        # threaded server never forks with locks held.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'GRAPH_RENDER_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_render_worker,
+            )
+        return self._executor
+
+    def _discard_executor(self, executor):
+        # Caller must hold self._lock. A worker that died (killed for memory,
+        # crashed) breaks the whole executor for good, so the next job gets
+        # a new one; jobs queued on the old one have already failed.
+        if self._executor is not executor:
+            return
+        logger.warning("Graph render pool broke; starting a new one")
+        self._executor = None
+        self._jobs = {key: future for key, future in self._jobs.items() if not future.done()}
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, key, job, on_done=None, func=render_graph_job):
+        """
+        Queue ``func(job)`` under ``key`` and return its future. If a job with
+        the same key is already queued or running, its future is returned
+        instead. ``func`` must be importable by the workers.
+        """
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is not None and not future.done():
+                return future
+            if len(self._jobs) >= getattr(settings, 'GRAPH_RENDER_QUEUE_LIMIT', 16):
+                raise RenderQueueFull(key)
+
+            executor = self._get_executor()
+            try:
+                future = executor.submit(func, job)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(func, job)
+            self._jobs[key] = future
+
+        def finished(f):
+            with self._lock:
+                if self._jobs.get(key) is f:
+                    del self._jobs[key]
+                if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+                    self._discard_executor(executor)
+            if on_done is not None and not f.cancelled() and f.exception() is None:
+                on_done(*f.result())
+
+        future.add_done_callback(finished)
+        return future
+
+    def render(self, key, job, timeout=None, on_done=None):
+        """
+        Wait up to ``timeout`` seconds for the image. Raises
+        ``concurrent.futures.TimeoutError`` if it is not ready; the job keeps
+        running and a later call with the same key picks it up.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'GRAPH_RENDER_TIMEOUT', 10)
+        return self.submit(key, job, on_done=on_done).result(timeout=timeout)
+
+
+render_pool = GraphRenderPool()
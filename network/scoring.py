@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from .models import BuddyLink, StudyBuddyInvite, UserCourse, UserProfile, WEEKDAY_BITS
+from .suggestion_index import SCORE_WEIGHTS, styles_compatible
+
+# network/scoring.py
+#
+# Campus-wide scoring with sparse matrices, for the batch job. Produces the
+# same rankings as SuggestionIndex.rank() and rank_foaf_candidates(), but
+# for a whole block of users per matrix product:
+#
+#   shared courses   (user x course) @ (user x course).T
+#   mutual buddies   (user x user buddy adjacency) squared
+#
+# and the weekday overlap, study style and school checks applied to the
+# non-zero pairs only. NumPy and SciPy are only needed here, so they are
+# imported when scoring runs.
+
+DEFAULT_BLOCK_SIZE = 1000
+
+
+def _require_numpy():
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError as exc:
+        raise ImportError("Matrix scoring needs numpy and scipy installed") from exc
+    return np, sparse
+
+
+@contextmanager
+def _snapshot():
+    # One state of all tables for the loading queries. Postgres only takes
+    # an isolation level before a transaction's first query, so inside a
+    # caller's transaction its level applies instead.
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+class CampusMatrices:
+    """Everything scoring needs, loaded from one database snapshot in four queries."""
+
+    def __init__(self):
+        np, sparse = _require_numpy()
+
+        with _snapshot():
+            rows = list(UserProfile.objects.order_by('id').values_list(
+                'id', 'study_style', 'school', 'available_weekdays_mask'))
+            enrollments = list(UserCourse.objects.values_list('user_profile_id', 'course_id'))
+            links = list(BuddyLink.objects.values_list('owner_id', 'buddy_id'))
+            invites = list(StudyBuddyInvite.objects.values_list('sender_id', 'receiver_id'))
+
+        self.n = len(rows)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.masks = np.array([row[3] for row in rows], dtype=np.int64)
+
+        styles = sorted({row[1] for row in rows}, key=str)
+        style_codes = {style: code for code, style in enumerate(styles)}
+        self.styles = np.array([style_codes[row[1]] for row in rows], dtype=np.int64)
+        self.style_compatible = np.array(
+            [[styles_compatible(a, b) for b in styles] for a in styles], dtype=bool).reshape(len(styles), len(styles))
+
+        schools = sorted({row[2] or '' for row in rows})
+        school_codes = {school: code for code, school in enumerate(schools)}
+        self.schools = np.array([school_codes[row[2] or ''] for row in rows], dtype=np.int64)
+        self.no_school = school_codes.get('', -1)
+
+        # Number of days in each 7-bit weekday mask
+        self.popcount = np.array([bin(mask).count('1') for mask in range(1 << len(WEEKDAY_BITS))], dtype=np.int64)
+
+        enrollments = self._known(np, enrollments, columns=[0])
+        course_ids, course_index = np.unique(enrollments[:, 1], return_inverse=True)
+        self.courses = sparse.csr_matrix(
+            (np.ones(len(enrollments), dtype=np.int32), (self.index_of(enrollments[:, 0]), course_index)),
+            shape=(self.n, len(course_ids)),
+        )
+        self.course_sets = {}
+        for profile_id, course_id in enrollments.tolist():
+            self.course_sets.setdefault(profile_id, set()).add(course_id)
+
+        links = self._known(np, links)
+        owners, buddies = self.index_of(links[:, 0]), self.index_of(links[:, 1])
+        self.buddies = sparse.csr_matrix(
+            (np.ones(len(links), dtype=np.int32), (owners, buddies)), shape=(self.n, self.n))
+        self.buddy_sets = {}
+        for owner_id, buddy_id in links.tolist():
+            self.buddy_sets.setdefault(owner_id, set()).add(buddy_id)
+
+        # Invited either way, as sorted pair keys (row index * n + column index)
+        invites = self._known(np, invites)
+        senders, receivers = self.index_of(invites[:, 0]), self.index_of(invites[:, 1])
+        self.invited_keys = np.unique(np.concatenate([senders * self.n + receivers, receivers * self.n + senders]))
+        self.buddy_keys = np.unique(owners * self.n + buddies)
+
+    def _known(self, np, pairs, columns=(0, 1)):
+        # Drop rows naming a profile that is not in self.ids (possible when
+        # loading inside a caller's READ COMMITTED transaction)
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        keep = np.isin(pairs[:, list(columns)], self.ids).all(axis=1)
+        return pairs[keep]
+
+    def index_of(self, profile_ids):
+        np, _ = _require_numpy()
+        return np.searchsorted(self.ids, profile_ids)
+
+
+def _top_k(np, rows, cols, scores, ids, k):
+    # Per row: best score first, then lowest profile id (as the live ranking)
+    order = np.lexsort((ids[cols], -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    keep = rank < k
+    return rows[keep], cols[keep], scores[keep]
+
+
+def _blocks(np, matrices, profile_ids, block_size):
+    # Profiles created after the matrices were loaded get no rows
+    profile_ids = np.asarray(sorted(profile_ids), dtype=np.int64)
+    targets = matrices.index_of(profile_ids[np.isin(profile_ids, matrices.ids)])
+    for start in range(0, len(targets), block_size):
+        yield targets[start:start + block_size]
+
+
+def score_suggestions(matrices, profile_ids, k, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    {profile_id: [(candidate_id, score, shared_course_ids, shared_weekdays_mask), ...]}
+    for ``profile_ids``, best first, at most ``k`` each.
+    """
+    np, _ = _require_numpy()
+    m = matrices
+    results = {int(profile_id): [] for profile_id in profile_ids}
+    if m.courses.shape[1] == 0:
+        return results
+
+    for block in _blocks(np, m, profile_ids, block_size):
+        shared = (m.courses[block] @ m.courses.T).tocoo()
+        rows, cols, course_counts = block[shared.row], shared.col, shared.data.astype(np.int64)
+
+        shared_masks = m.masks[rows] & m.masks[cols]
+        keep = (
+            (rows != cols)
+            & (shared_masks > 0)
+            & m.style_compatible[m.styles[rows], m.styles[cols]]
+            & ~np.isin(rows * m.n + cols, m.invited_keys)
+        )
+        rows, cols, course_counts, shared_masks = rows[keep], cols[keep], course_counts[keep], shared_masks[keep]
+
+        scores = (
+            SCORE_WEIGHTS['shared_course'] * course_counts
+            + SCORE_WEIGHTS['shared_day'] * m.popcount[shared_masks]
+            + SCORE_WEIGHTS['same_style'] * (m.styles[rows] == m.styles[cols])
+            + SCORE_WEIGHTS['same_school'] * ((m.schools[rows] == m.schools[cols]) & (m.schools[rows] != m.no_school))
+        )
+        rows, cols, scores = _top_k(np, rows, cols, scores, m.ids, k)
+
+        for row, col, score in zip(rows.tolist(), cols.tolist(), scores.tolist()):
+            profile_id, candidate_id = int(m.ids[row]), int(m.ids[col])
+            results[profile_id].append((
+                candidate_id,
+                float(score),
+                m.course_sets.get(profile_id, set()) & m.course_sets.get(candidate_id, set()),
+                int(m.masks[row] & m.masks[col]),
+            ))
+    return results
+
+
+def score_foaf(matrices, profile_ids, k, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    {profile_id: [(foaf_id, [mutual buddy ids]), ...]} for ``profile_ids``,
+    most mutual buddies first, at most ``k`` each.
+    """
+    np, _ = _require_numpy()
+    m = matrices
+    results = {int(profile_id): [] for profile_id in profile_ids}
+
+    for block in _blocks(np, m, profile_ids, block_size):
+        mutual = (m.buddies[block] @ m.buddies).tocoo()
+        rows, cols, counts = block[mutual.row], mutual.col, mutual.data.astype(np.int64)
+
+        keys = rows * m.n + cols
+        keep = (rows != cols) & ~np.isin(keys, m.buddy_keys) & ~np.isin(keys, m.invited_keys)
+        rows, cols, counts = _top_k(np, rows[keep], cols[keep], counts[keep], m.ids, k)
+
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            profile_id, foaf_id = int(m.ids[row]), int(m.ids[col])
+            mutual_ids = m.buddy_sets.get(profile_id, set()) & m.buddy_sets.get(foaf_id, set())
+            results[profile_id].append((foaf_id, sorted(mutual_ids)))
+    return results
@@ -1,7 +1,15 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile, StudyBuddyInvite, StudyBuddy, UserCourse
+from .conditional import (
+    COURSES_PAGE_STAMP, EVENTS_PAGE_STAMP, buddies_page_stamp, profile_page_stamp, profile_pages_changed, touch,
+)
+from .graph_store import study_graph
+from .messaging import publish_message
+from .rec_cache import recommendation_cache
+from .suggestion_index import suggestion_index
+from .models import UserProfile, StudyBuddyInvite, StudyBuddy, BuddyLink, UserCourse, DirectMessage, Course, Event, enrollment_changed
 
 
 @receiver(post_save, sender=User)
@@ -16,11 +24,16 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=StudyBuddyInvite)
 def create_study_session(sender, instance, created, **kwargs):
-    if instance.status == 'accepted' and not hasattr(instance, 'studysession'):
-        StudyBuddy.objects.create(
-            participant_one=instance.sender,
-            participant_two=instance.receiver,
-        )
+    # Invites accepted outside StudyBuddyInvite.accept() (e.g. the admin);
+    # a no-op when the pair already exists
+    if instance.status == 'accepted':
+        StudyBuddy.objects.get_or_create_pair(instance.sender_id, instance.receiver_id)
+
+@receiver(post_save, sender=StudyBuddy)
+def create_buddy_links(sender, instance, created, **kwargs):
+    # Both directions; deleting the pair cascades to them
+    if created:
+        BuddyLink.objects.bulk_create(BuddyLink.for_pairs([instance]), ignore_conflicts=True)
 
 @receiver(post_save, sender=UserProfile)
 def create_user_course(sender, instance, created, **kwargs):
@@ -30,4 +43,178 @@ def create_user_course(sender, instance, created, **kwargs):
             UserCourse.objects.create(
                 user_profile=instance.profile,
                 course=course
-            )
\ No newline at end of file
+            )
+
+
+# --- Keep the in-memory study graph current (see network/graph_store.py) ---
+# Deltas are applied on commit so a rolled back write never reaches the graph.
+
+# Nodes only carry the username, so other profile edits leave the graph (and
+# its version, which keys cached images, layouts and ETags) alone.
+
+@receiver(post_save, sender=UserProfile)
+def graph_profile_saved(sender, instance, created, **kwargs):
+    if created:
+        profile_id, username = instance.id, instance.user.username
+        transaction.on_commit(lambda: study_graph.profile_saved(profile_id, username))
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # Not loading a deferred field here; an unknown username counts as changed
+    instance._loaded_username = instance.__dict__.get('username')
+
+@receiver(post_save, sender=User)
+def graph_username_changed(sender, instance, created, **kwargs):
+    username = instance.username
+    if created or username == instance._loaded_username:
+        return
+    instance._loaded_username = username
+    profile_id = UserProfile.objects.filter(user=instance).values_list('id', flat=True).first()
+    if profile_id is not None:
+        transaction.on_commit(lambda: study_graph.profile_saved(profile_id, username))
+
+@receiver(post_delete, sender=UserProfile)
+def graph_profile_deleted(sender, instance, **kwargs):
+    profile_id = instance.id
+    transaction.on_commit(lambda: study_graph.profile_deleted(profile_id))
+
+@receiver(post_save, sender=StudyBuddy)
+def graph_buddy_saved(sender, instance, created, **kwargs):
+    if created:
+        one_id, two_id = instance.participant_one_id, instance.participant_two_id
+        transaction.on_commit(lambda: study_graph.buddy_added(one_id, two_id))
+
+@receiver(post_delete, sender=StudyBuddy)
+def graph_buddy_deleted(sender, instance, **kwargs):
+    one_id, two_id = instance.participant_one_id, instance.participant_two_id
+    transaction.on_commit(lambda: study_graph.buddy_removed(one_id, two_id))
+
+@receiver(post_save, sender=StudyBuddyInvite)
+def graph_invite_saved(sender, instance, **kwargs):
+    invite_id, sender_id, receiver_id, status = (
+        instance.id, instance.sender_id, instance.receiver_id, instance.status)
+    transaction.on_commit(lambda: study_graph.invite_saved(invite_id, sender_id, receiver_id, status))
+
+@receiver(post_delete, sender=StudyBuddyInvite)
+def graph_invite_deleted(sender, instance, **kwargs):
+    invite_id, sender_id, receiver_id = instance.id, instance.sender_id, instance.receiver_id
+    transaction.on_commit(lambda: study_graph.invite_deleted(invite_id, sender_id, receiver_id))
+
+
+# --- Keep the course/weekday suggestion index current (see network/suggestion_index.py) ---
+# Cached recommendations (network/rec_cache.py) are invalidated in the same
+# callback, after the index has the new data.
+
+@receiver(post_save, sender=UserProfile)
+def index_profile_saved(sender, instance, **kwargs):
+    profile_id, style, school, weekdays_mask = (
+        instance.id, instance.study_style, instance.school, instance.available_weekdays_mask)
+
+    def apply():
+        if suggestion_index.profile_saved(profile_id, style, school, weekdays_mask):
+            recommendation_cache.profile_changed(profile_id)
+    transaction.on_commit(apply)
+
+@receiver(post_delete, sender=UserProfile)
+def index_profile_deleted(sender, instance, **kwargs):
+    profile_id = instance.id
+    transaction.on_commit(lambda: suggestion_index.profile_deleted(profile_id))
+
+@receiver(post_save, sender=UserCourse)
+def index_enrollment_saved(sender, instance, created, **kwargs):
+    if created:
+        profile_id, course_id = instance.user_profile_id, instance.course_id
+
+        def apply():
+            suggestion_index.enrollment_added(profile_id, course_id)
+            recommendation_cache.enrollments_changed(profile_id, [course_id])
+        transaction.on_commit(apply)
+
+@receiver(post_delete, sender=UserCourse)
+def index_enrollment_deleted(sender, instance, **kwargs):
+    profile_id, course_id = instance.user_profile_id, instance.course_id
+
+    def apply():
+        suggestion_index.enrollment_removed(profile_id, course_id)
+        recommendation_cache.enrollments_changed(profile_id, [course_id])
+    transaction.on_commit(apply)
+
+@receiver(enrollment_changed, sender=UserProfile)
+def index_enrollments_changed(sender, profile_id, added_ids, removed_ids, **kwargs):
+
+    def apply():
+        suggestion_index.enrollments_changed(profile_id, added_ids, removed_ids)
+        recommendation_cache.enrollments_changed(profile_id, added_ids | removed_ids)
+    transaction.on_commit(apply)
+
+
+# --- Invalidate cached recommendations (see network/rec_cache.py) ---
+
+@receiver(post_save, sender=StudyBuddy)
+@receiver(post_delete, sender=StudyBuddy)
+def recs_buddy_changed(sender, instance, created=True, **kwargs):
+    if created:
+        one_id, two_id = instance.participant_one_id, instance.participant_two_id
+        transaction.on_commit(lambda: recommendation_cache.buddies_changed(one_id, two_id))
+
+@receiver(post_save, sender=StudyBuddyInvite)
+@receiver(post_delete, sender=StudyBuddyInvite)
+def recs_invite_changed(sender, instance, created=True, **kwargs):
+    # Invited users drop out of each other's suggestions and FOAFs; a status
+    # change alone does not matter (acceptance creates a StudyBuddy)
+    if created:
+        profile_ids = [instance.sender_id, instance.receiver_id]
+        transaction.on_commit(lambda: recommendation_cache.users_changed(profile_ids))
+
+
+# --- Page validators (see network/conditional.py) ---
+
+@receiver(post_save, sender=UserProfile)
+def pages_profile_saved(sender, instance, **kwargs):
+    profile_id = instance.id
+    transaction.on_commit(lambda: profile_pages_changed(profile_id))
+
+@receiver(post_save, sender=User)
+def pages_user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Usernames show on the pages; logins only touch last_login
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    profile_id = UserProfile.objects.filter(user=instance).values_list('id', flat=True).first()
+    if profile_id is not None:
+        transaction.on_commit(lambda: profile_pages_changed(profile_id))
+
+@receiver(post_save, sender=UserCourse)
+@receiver(post_delete, sender=UserCourse)
+def pages_enrollment_changed(sender, instance, created=True, **kwargs):
+    if created:
+        stamp = profile_page_stamp(instance.user_profile_id)
+        transaction.on_commit(lambda: touch([stamp]))
+
+@receiver(enrollment_changed, sender=UserProfile)
+def pages_enrollments_changed(sender, profile_id, **kwargs):
+    transaction.on_commit(lambda: touch([profile_page_stamp(profile_id)]))
+
+@receiver(post_save, sender=StudyBuddy)
+@receiver(post_delete, sender=StudyBuddy)
+def pages_buddy_changed(sender, instance, created=True, **kwargs):
+    if created:
+        stamps = [buddies_page_stamp(instance.participant_one_id), buddies_page_stamp(instance.participant_two_id)]
+        transaction.on_commit(lambda: touch(stamps))
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def pages_event_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch([EVENTS_PAGE_STAMP]))
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def pages_course_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch([COURSES_PAGE_STAMP]))
+
+
+# --- Push new direct messages to connected clients (see network/pubsub.py) ---
+
+@receiver(post_save, sender=DirectMessage)
+def push_direct_message(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: publish_message(instance))
@@ -0,0 +1,165 @@
+import heapq
+from collections import Counter
+
+from .instrumentation import incr
+from .models import UserProfile, UserCourse
+from .versioning import VersionedStore
+
+# network/suggestion_index.py
+#
+# An inverted index from course to profiles, plus each profile's style,
+# school and weekday mask, built once per process and kept current by
+# network/signals.py. Ranking a user's suggestions only touches the
+# postings of their own courses, never the whole profile table.
+
+SUGGESTION_INDEX_VERSION_NAME = 'suggestion_index'
+
+# How much each kind of overlap counts towards a suggestion's score
+SCORE_WEIGHTS = {
+    'shared_course': 3.0,
+    'shared_day': 1.0,
+    'same_style': 1.0,
+    'same_school': 0.5,
+}
+
+
+def styles_compatible(style1, style2):
+    # Match if same style or either is 'mixed'
+    return style1 == style2 or style1 == 'mixed' or style2 == 'mixed'
+
+
+class SuggestionIndexData:
+    def __init__(self):
+        self.profiles = {}          # profile id -> {'style', 'school', 'courses', 'weekdays_mask'}
+        self.by_course = {}         # course id -> set of profile ids
+
+    def _new_entry(self, profile_id):
+        return self.profiles.setdefault(
+            profile_id, {'style': None, 'school': '', 'courses': set(), 'weekdays_mask': 0})
+
+    def set_profile(self, profile_id, style, school, weekdays_mask):
+        # True if anything suggestions depend on changed
+        new = profile_id not in self.profiles
+        entry = self._new_entry(profile_id)
+        changed = new or (entry['style'], entry['school'], entry['weekdays_mask']) != (style, school, weekdays_mask)
+        entry['style'] = style
+        entry['school'] = school
+        entry['weekdays_mask'] = weekdays_mask
+        return changed
+
+    def remove_profile(self, profile_id):
+        entry = self.profiles.pop(profile_id, None)
+        if entry is None:
+            return False
+        for course_id in entry['courses']:
+            self.by_course.get(course_id, set()).discard(profile_id)
+        return True
+
+    def add_enrollment(self, profile_id, course_id):
+        entry = self._new_entry(profile_id)
+        changed = course_id not in entry['courses']
+        entry['courses'].add(course_id)
+        self.by_course.setdefault(course_id, set()).add(profile_id)
+        return changed
+
+    def remove_enrollment(self, profile_id, course_id):
+        entry = self.profiles.get(profile_id)
+        changed = entry is not None and course_id in entry['courses']
+        if entry is not None:
+            entry['courses'].discard(course_id)
+        self.by_course.get(course_id, set()).discard(profile_id)
+        return changed
+
+
+def build_suggestion_index():
+    data = SuggestionIndexData()
+    profiles = UserProfile.objects.values_list('id', 'study_style', 'school', 'available_weekdays_mask')
+    for profile_id, style, school, weekdays_mask in profiles:
+        data.set_profile(profile_id, style, school, weekdays_mask)
+    for profile_id, course_id in UserCourse.objects.values_list('user_profile_id', 'course_id'):
+        data.add_enrollment(profile_id, course_id)
+    return data
+
+
+class SuggestionIndex(VersionedStore):
+    version_name = SUGGESTION_INDEX_VERSION_NAME
+
+    def load(self):
+        return build_suggestion_index()
+
+    def rank(self, user_profile, excluded_ids=(), limit=None, offset=0):
+        """
+        Score everyone sharing at least one course and one weekday with
+        ``user_profile`` and return a page of
+        ``(profile_id, score, shared_course_ids, shared_weekdays_mask)``,
+        best first.
+        """
+        with self.lock:
+            data = self._current()
+            me = data.profiles.get(user_profile.id, {'courses': set()})
+            my_courses = me['courses']
+            my_mask = user_profile.available_weekdays_mask
+
+            shared_course_counts = Counter()
+            for course_id in my_courses:
+                shared_course_counts.update(data.by_course.get(course_id, ()))
+
+            scored = []
+            for profile_id, course_count in shared_course_counts.items():
+                if profile_id in excluded_ids:
+                    continue
+                other = data.profiles[profile_id]
+                shared_mask = my_mask & other['weekdays_mask']
+                if not shared_mask or not styles_compatible(user_profile.study_style, other['style']):
+                    continue
+                score = (
+                    SCORE_WEIGHTS['shared_course'] * course_count
+                    + SCORE_WEIGHTS['shared_day'] * shared_mask.bit_count()
+                    + SCORE_WEIGHTS['same_style'] * (other['style'] == user_profile.study_style)
+                    + SCORE_WEIGHTS['same_school'] * (bool(other['school']) and other['school'] == user_profile.school)
+                )
+                scored.append((score, -profile_id, my_courses & other['courses'], shared_mask))
+
+        # Considered: shares a course. Pruned: excluded, no common day or
+        # incompatible style.
+        incr('suggestions.candidates', len(shared_course_counts))
+        incr('suggestions.pruned', len(shared_course_counts) - len(scored))
+
+        if limit is None:
+            ranked = sorted(scored, reverse=True)[offset:]
+        else:
+            ranked = heapq.nlargest(offset + limit, scored)[offset:]
+        return [
+            (-negative_id, score, shared_course_ids, shared_mask)
+            for score, negative_id, shared_course_ids, shared_mask in ranked
+        ]
+
+    def courses_of(self, profile_id):
+        with self.lock:
+            entry = self._current().profiles.get(profile_id)
+            return set(entry['courses']) if entry else set()
+
+    # --- Deltas, called from network/signals.py ---
+
+    def profile_saved(self, profile_id, style, school, weekdays_mask):
+        # False only when the index knew the profile and nothing changed
+        return self._apply(lambda data: data.set_profile(profile_id, style, school, weekdays_mask)) is not False
+
+    def profile_deleted(self, profile_id):
+        self._apply(lambda data: data.remove_profile(profile_id))
+
+    def enrollment_added(self, profile_id, course_id):
+        self._apply(lambda data: data.add_enrollment(profile_id, course_id))
+
+    def enrollment_removed(self, profile_id, course_id):
+        self._apply(lambda data: data.remove_enrollment(profile_id, course_id))
+
+    def enrollments_changed(self, profile_id, added_ids, removed_ids):
+        def change(data):
+            removed = [data.remove_enrollment(profile_id, course_id) for course_id in removed_ids]
+            added = [data.add_enrollment(profile_id, course_id) for course_id in added_ids]
+            return any(removed) or any(added)
+        self._apply(change)
+
+
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,202 @@
+import random
+from datetime import date, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .graph_store import study_graph
+from .models import (
+    BuddyLink, Course, DirectMessage, Event, EventAudience, StudyBuddy, StudyBuddyInvite, UserCourse, UserProfile,
+    SCHOOL_CHOICES, WEEKDAY_CHOICES, weekdays_to_mask,
+)
+from .suggestion_index import suggestion_index
+
+# network/synthetic.py
+#
+# Synthetic campus for load testing and benchmarks (see the seed_campus and
+# benchmark_network commands). Rows are bulk inserted, so no signals fire;
+# the in-memory graph and suggestion index are invalidated at the end
+# instead. Every generated user's name starts with the prefix, which is how
+# clear_campus finds them again.
+
+DEFAULT_PREFIX = 'synth_'
+
+MAJORS = ['cs', 'math', 'physics', 'biology', 'chemistry', 'economics', 'history', 'design']
+STUDY_STYLES = ['quiet', 'discussion', 'flashcards', 'mixed']
+SAMPLE_MESSAGES = [
+    "Are you free to go over the problem set?",
+    "I can do the library after lunch.",
+    "Did you get question 3?",
+    "Sharing my notes from today.",
+    "See you at the study session!",
+]
+
+
+def _zipf_weights(n, exponent=1.0):
+    # A few very popular items and a long tail
+    return [1 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def _preferential_pairs(profile_ids, count, rng):
+    """
+    ``count`` distinct unordered pairs, picking each endpoint with
+    probability proportional to its degree so far (plus one). Gives the
+    heavy-tailed degree distribution of real friendship graphs.
+    """
+    if len(profile_ids) < 2:
+        return set()
+    endpoints = list(profile_ids)  # everyone starts with weight one
+    pairs = set()
+    attempts = 0
+    while len(pairs) < count and attempts < count * 10:
+        attempts += 1
+        a, b = rng.choice(endpoints), rng.choice(endpoints)
+        if a == b:
+            continue
+        pair = (min(a, b), max(a, b))
+        if pair in pairs:
+            continue
+        pairs.add(pair)
+        endpoints.extend(pair)
+    return pairs
+
+
+def clear_campus(prefix=DEFAULT_PREFIX):
+    # Profiles, enrollments, buddies, invites, messages and events cascade
+    deleted, _ = User.objects.filter(username__startswith=prefix).delete()
+    Course.objects.filter(code__startswith=prefix.upper()).delete()
+    study_graph.invalidate()
+    suggestion_index.invalidate()
+    return deleted
+
+
+def seed_campus(users=1000, courses=None, courses_per_user=4, buddies_per_user=3,
+                invites_per_user=2, messages_per_buddy=2, events=None,
+                prefix=DEFAULT_PREFIX, seed=0, batch_size=5000, stdout=None):
+    """
+    Insert a synthetic campus and return the number of rows of each kind.
+    Course enrolment follows a Zipf distribution and buddy pairs use
+    preferential attachment; the per-user figures are averages.
+    """
+    rng = random.Random(seed)
+    courses = courses or max(users // 20, 10)
+    events = events if events is not None else max(users // 50, 5)
+    counts = {}
+
+    def progress(kind, n):
+        counts[kind] = n
+        if stdout is not None:
+            stdout.write(f"  {kind}: {n}")
+
+    with transaction.atomic():
+        course_objs = Course.objects.bulk_create(
+            [Course(code=f"{prefix.upper()}{i:05d}", name=f"Synthetic Course {i}") for i in range(courses)],
+            batch_size=batch_size,
+        )
+        progress('courses', len(course_objs))
+
+        # One hash for everyone; hashing per user would dominate the run
+        password = make_password('synthetic')
+        user_objs = User.objects.bulk_create(
+            [User(username=f"{prefix}{i:06d}", password=password) for i in range(users)],
+            batch_size=batch_size,
+        )
+        weekday_codes = [code for code, _ in WEEKDAY_CHOICES]
+        schools = [code for code, _ in SCHOOL_CHOICES]
+        profiles = []
+        for user in user_objs:
+            weekdays = sorted(rng.sample(weekday_codes, rng.randint(1, 5)), key=weekday_codes.index)
+            profiles.append(UserProfile(
+                user=user,
+                school=rng.choice(schools),
+                major=rng.choice(MAJORS),
+                year_of_study=rng.randint(1, 5),
+                study_style=rng.choice(STUDY_STYLES),
+                available_weekdays=weekdays,
+                available_weekdays_mask=weekdays_to_mask(weekdays),
+            ))
+        profiles = UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+        profile_ids = [p.id for p in profiles]
+        progress('profiles', len(profiles))
+
+        course_weights = _zipf_weights(len(course_objs))
+        enrollments = []
+        for profile_id in profile_ids:
+            taken = set()
+            for course in rng.choices(course_objs, weights=course_weights, k=max(1, int(rng.expovariate(1 / courses_per_user)))):
+                if course.id not in taken:
+                    taken.add(course.id)
+                    enrollments.append(UserCourse(user_profile_id=profile_id, course_id=course.id))
+        UserCourse.objects.bulk_create(enrollments, batch_size=batch_size)
+        progress('enrollments', len(enrollments))
+
+        buddy_pairs = _preferential_pairs(profile_ids, users * buddies_per_user // 2, rng)
+        buddy_objs = StudyBuddy.objects.bulk_create(
+            [StudyBuddy(participant_one_id=a, participant_two_id=b) for a, b in buddy_pairs],
+            batch_size=batch_size,
+        )
+        BuddyLink.objects.bulk_create(BuddyLink.for_pairs(buddy_objs), batch_size=batch_size)
+        progress('buddy_pairs', len(buddy_pairs))
+
+        # Invites between people who are not buddies yet, mostly pending
+        invite_pairs = set()
+        for _ in range(users * invites_per_user):
+            sender_id, receiver_id = rng.sample(profile_ids, 2)
+            if (min(sender_id, receiver_id), max(sender_id, receiver_id)) in buddy_pairs:
+                continue
+            if (receiver_id, sender_id) in invite_pairs:
+                continue
+            invite_pairs.add((sender_id, receiver_id))
+        StudyBuddyInvite.objects.bulk_create(
+            [
+                StudyBuddyInvite(
+                    sender_id=sender_id, receiver_id=receiver_id,
+                    status=rng.choices(['pending', 'rejected'], weights=[4, 1])[0],
+                )
+                for sender_id, receiver_id in invite_pairs
+            ],
+            batch_size=batch_size,
+        )
+        progress('invites', len(invite_pairs))
+
+        messages = []
+        for a, b in buddy_pairs:
+            for _ in range(rng.randint(0, 2 * messages_per_buddy)):
+                sender_id, receiver_id = (a, b) if rng.random() < 0.5 else (b, a)
+                messages.append(DirectMessage(
+                    sender_id=sender_id, receiver_id=receiver_id,
+                    message=rng.choice(SAMPLE_MESSAGES), is_read=rng.random() < 0.7,
+                ))
+        DirectMessage.objects.bulk_create(messages, batch_size=batch_size)
+        progress('messages', len(messages))
+
+        today = date.today()
+        event_objs = []
+        for i in range(events):
+            event_objs.append(Event(
+                organizer_id=rng.choice(profile_ids),
+                title=f"Synthetic event {i}",
+                description="Generated by seed_campus.",
+                date=today + timedelta(days=rng.randint(-30, 60)),
+                time=time(rng.randint(8, 20), rng.choice([0, 30])),
+                target_school=rng.choice(schools + [None]),
+                target_major=rng.choice(MAJORS + [None, None]),
+            ))
+        event_objs = Event.objects.bulk_create(event_objs, batch_size=batch_size)
+        # bulk_create skips Event.save(), so write the audiences here
+        EventAudience.objects.bulk_create(
+            [
+                EventAudience(
+                    event_id=event.id, school=event.target_school or '', major=event.target_major or '',
+                    date=event.date, time=event.time,
+                )
+                for event in event_objs
+            ],
+            batch_size=batch_size,
+        )
+        progress('events', len(event_objs))
+
+    study_graph.invalidate()
+    suggestion_index.invalidate()
+    return counts
@@ -1,6 +1,15 @@
 from django import template
+
+from network.thumbnails import thumbnail_url
+
 register = template.Library()
 
 @register.filter
 def dict_get(dict_obj, key):
     return dict_obj.get(key)
+
+
+@register.filter
+def avatar(profile, size='sm'):
+    # {{ profile|avatar:'md' }}: URL of the picture at one of THUMBNAIL_SIZES
+    return thumbnail_url(profile, size)
@@ -1,3 +1,825 @@
-from django.test import TestCase
+import json
+import io
+import random
+import tempfile
+from collections import deque
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .courses import search_courses
+from .forms import UserProfileForm
+from .graph_store import study_graph
+from .messaging import conversation_page, decode_cursor, encode_cursor
+from .models import (
+    BuddyLink, Course, DirectMessage, Event, Recommendation, RecommendationState, StaleCourse, StudyBuddy,
+    StudyBuddyInvite, UserCourse, UserProfile, weekdays_to_mask,
+)
+from .scoring import CampusMatrices, score_foaf, score_suggestions
+from .rec_batch import mark_courses_stale, mark_users_stale, precomputed_foaf, stale_profiles, store_recommendations
+from .suggestion_index import suggestion_index
+from .thumbnails import thumbnail_url
+from .utils import get_foaf_recommendations, rank_foaf_candidates, rank_suggestions
+
+
+def make_user(username, **profile_fields):
+    # The profile comes from the post_save signal on User
+    user = User.objects.create_user(username=username)
+    profile = user.userprofile
+    if profile_fields:
+        for field, value in profile_fields.items():
+            setattr(profile, field, value)
+        profile.save()
+    return profile
+
+
+class NetworkTestCase(TestCase):
+    # The stores are per-process and keep their data between tests
+    def setUp(self):
+        cache.clear()
+        study_graph.invalidate()
+
+
+class GraphStoreSignalTests(NetworkTestCase):
+    def test_profile_edit_keeps_graph_version(self):
+        profile = make_user('ada')
+        version = study_graph.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.bio = "Likes proofs"
+            profile.available_weekdays = ['mon']
+            profile.save()
+        self.assertEqual(study_graph.current_version(), version)
+
+    def test_new_profile_and_rename_reach_graph(self):
+        study_graph.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = make_user('ada')
+        _, labels, _ = study_graph.whole_view([profile.id])
+        self.assertEqual(labels, {profile.id: 'ada'})
+
+        version = study_graph.current_version()
+        user = User.objects.get(pk=profile.user_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.username = 'lovelace'
+            user.save()
+        self.assertEqual(study_graph.current_version(), version + 1)
+        _, labels, _ = study_graph.whole_view([profile.id])
+        self.assertEqual(labels, {profile.id: 'lovelace'})
+
+    def test_login_keeps_graph_version(self):
+        profile = make_user('ada')
+        version = study_graph.current_version()
+        user = User.objects.get(pk=profile.user_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+        self.assertEqual(study_graph.current_version(), version)
+
+
+def befriend(one, two):
+    # BuddyLink rows come from the post_save signal on StudyBuddy
+    return StudyBuddy.objects.get_or_create_pair(one.id, two.id)[0]
+
+
+def reference_foaf_ranking(user_profile):
+    # The FOAF rules spelled out with the ORM, one user at a time
+    def buddies_of(profile_id):
+        pairs = StudyBuddy.objects.filter(Q(participant_one_id=profile_id) | Q(participant_two_id=profile_id))
+        return {one if one != profile_id else two for one, two in pairs.values_list('participant_one_id', 'participant_two_id')}
+
+    mine = buddies_of(user_profile.id)
+    invited = set(user_profile.sent_invites.values_list('receiver_id', flat=True))
+    invited |= set(user_profile.received_invites.values_list('sender_id', flat=True))
+    mutuals = {}
+    for buddy_id in mine:
+        for foaf_id in buddies_of(buddy_id):
+            if foaf_id != user_profile.id and foaf_id not in mine and foaf_id not in invited:
+                mutuals.setdefault(foaf_id, []).append(buddy_id)
+    ranked = sorted(mutuals.items(), key=lambda item: (-len(item[1]), item[0]))
+    return [(foaf_id, sorted(ids)) for foaf_id, ids in ranked]
+
+
+class SuggestionIndexTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        suggestion_index.invalidate()
+        self.course = Course.objects.create(code='CS101', name="Intro to Programming")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ada = make_user('ada', available_weekdays=['mon', 'tue'], study_style='quiet')
+            self.ada.set_courses([self.course])
+
+    def test_unchanged_save_keeps_version(self):
+        version = suggestion_index.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ada.bio = "Likes proofs"
+            self.ada.save()
+            self.ada.save()
+            self.ada.set_courses([self.course])
+        self.assertEqual(suggestion_index.current_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ada.study_style = 'discussion'
+            self.ada.save()
+        self.assertEqual(suggestion_index.current_version(), version + 1)
+
+    def test_rank_needs_a_shared_day(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bob = make_user('bob', available_weekdays=['tue', 'wed'], study_style='mixed')
+            cat = make_user('cat', available_weekdays=['fri'], study_style='quiet')
+            for profile in [bob, cat]:
+                profile.set_courses([self.course])
+        ranked = suggestion_index.rank(self.ada, excluded_ids={self.ada.id})
+        self.assertEqual([(profile_id, mask) for profile_id, _, _, mask in ranked],
+                         [(bob.id, weekdays_to_mask(['tue']))])
+
+
+class FoafRecommendationTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.me, self.b1, self.b2, self.b3, self.f1, self.f2, self.f3, self.invitee, self.inviter = [
+            make_user(name) for name in ['me', 'b1', 'b2', 'b3', 'f1', 'f2', 'f3', 'invitee', 'inviter']
+        ]
+        for buddy in (self.b1, self.b2, self.b3):
+            befriend(self.me, buddy)
+        # f1 shares three buddies with me, f2 two, f3 one
+        for buddy in (self.b1, self.b2, self.b3):
+            befriend(buddy, self.f1)
+        for buddy in (self.b1, self.b2):
+            befriend(buddy, self.f2)
+        befriend(self.b3, self.f3)
+        # Buddies of buddies who are also my buddies
+        befriend(self.b1, self.b2)
+        # Invited either way, whatever the status
+        befriend(self.b1, self.invitee)
+        befriend(self.b2, self.inviter)
+        StudyBuddyInvite.objects.create(sender=self.me, receiver=self.invitee, status='pending')
+        StudyBuddyInvite.objects.create(sender=self.inviter, receiver=self.me, status='rejected')
+
+    def test_ranking_and_mutual_buddies(self):
+        self.assertEqual(rank_foaf_candidates(self.me), [
+            (self.f1.id, sorted([self.b1.id, self.b2.id, self.b3.id])),
+            (self.f2.id, sorted([self.b1.id, self.b2.id])),
+            (self.f3.id, [self.b3.id]),
+        ])
+
+    def test_excludes_self_buddies_and_invited(self):
+        found = {foaf_id for foaf_id, _ in rank_foaf_candidates(self.me)}
+        excluded = {self.me.id, self.b1.id, self.b2.id, self.b3.id, self.invitee.id, self.inviter.id}
+        self.assertFalse(found & excluded)
+
+    def test_limit_keeps_the_best(self):
+        self.assertEqual([foaf_id for foaf_id, _ in rank_foaf_candidates(self.me, limit=2)], [self.f1.id, self.f2.id])
+
+    def test_hydrated_recommendations(self):
+        foafs = get_foaf_recommendations(self.me)
+        self.assertEqual([(f['name'], f['mutual_count']) for f in foafs], [('f1', 3), ('f2', 2), ('f3', 1)])
+        self.assertEqual(foafs[1]['buddy_names'], ['b1', 'b2'])
+
+    def test_matches_reference_on_random_network(self):
+        rng = random.Random(7)
+        people = [make_user(f'u{i}') for i in range(30)]
+        for _ in range(80):
+            one, two = rng.sample(people, 2)
+            befriend(one, two)
+        for _ in range(15):
+            one, two = rng.sample(people, 2)
+            StudyBuddyInvite.objects.create(sender=one, receiver=two, status=rng.choice(['pending', 'rejected']))
+        for person in people + [self.me, self.b1]:
+            self.assertEqual(rank_foaf_candidates(person), reference_foaf_ranking(person), person.user.username)
+
+
+class MatrixScoringTests(NetworkTestCase):
+    # network/scoring.py must rank exactly like the live code paths
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(11)
+        courses = Course.objects.bulk_create(Course(code=f'C{i}', name=f"Course {i}") for i in range(8))
+        weekdays = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+        self.people = [
+            make_user(
+                f'u{i}', available_weekdays=rng.sample(weekdays, rng.randint(0, 3)),
+                study_style=rng.choice(['quiet', 'discussion', 'flashcards', 'mixed']),
+                school=rng.choice(['circle', 'square', '']), major="CS", year_of_study=1,
+            )
+            for i in range(40)
+        ]
+        for person in self.people:
+            person.set_courses(rng.sample(courses, rng.randint(0, 3)))
+        for _ in range(70):
+            befriend(*rng.sample(self.people, 2))
+        for _ in range(15):
+            one, two = rng.sample(self.people, 2)
+            StudyBuddyInvite.objects.get_or_create(sender=one, receiver=two, defaults={'status': 'pending'})
+        suggestion_index.invalidate()
+
+    def test_suggestions_match_rank_suggestions(self):
+        ids = [person.id for person in self.people]
+        for k in [3, 50]:
+            scored = score_suggestions(CampusMatrices(), ids, k)
+            for person in self.people:
+                self.assertEqual(scored[person.id], rank_suggestions(person, limit=k), (k, person.user.username))
+
+    def test_foaf_matches_rank_foaf_candidates(self):
+        ids = [person.id for person in self.people]
+        for k in [2, 50]:
+            scored = score_foaf(CampusMatrices(), ids, k)
+            for person in self.people:
+                self.assertEqual(scored[person.id], rank_foaf_candidates(person, limit=k), (k, person.user.username))
+
+    def test_rows_of_profiles_missing_from_the_load_are_dropped(self):
+        # As if the last profile was created after the profile query ran
+        late = self.people[-1]
+        rows = list(UserProfile.objects.exclude(pk=late.pk).order_by('id').values_list(
+            'id', 'study_style', 'school', 'available_weekdays_mask'))
+        with patch('network.scoring.UserProfile') as profiles:
+            profiles.objects.order_by.return_value.values_list.return_value = rows
+            matrices = CampusMatrices()
+        self.assertNotIn(late.id, matrices.ids)
+        ids = [person.id for person in self.people]
+        scored = score_foaf(matrices, ids, 50)
+        self.assertEqual(scored[late.id], [])
+        for person in self.people[:-1]:
+            self.assertNotIn(late.id, [foaf_id for foaf_id, _ in scored[person.id]])
+
+
+class EgoSnapshotTests(NetworkTestCase):
+    def test_extra_nodes_fill_the_cap_in_the_given_order(self):
+        me, buddy, low, high = [make_user(name) for name in ['me', 'buddy', 'low', 'high']]
+        befriend(me, buddy)
+        G, _ = study_graph.ego_snapshot(me.id, radius=1, max_nodes=3, extra_nodes=[high.id, low.id, buddy.id])
+        self.assertEqual(set(G.nodes), {me.id, buddy.id, high.id})
+
+
+class ConversationPageTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ada, self.bob = make_user('ada'), make_user('bob')
+        befriend(self.ada, self.bob)
+
+    def send(self, count, timestamp=None):
+        messages = []
+        for i in range(count):
+            sender, receiver = (self.ada, self.bob) if i % 2 else (self.bob, self.ada)
+            messages.append(DirectMessage.objects.create(sender=sender, receiver=receiver, message=f"m{i}"))
+        if timestamp is not None:
+            DirectMessage.objects.filter(id__in=[m.id for m in messages]).update(timestamp=timestamp)
+        return [m.id for m in messages]
+
+    def walk(self, page_size):
+        # Every page from the newest back, as lists of ids, oldest first
+        pages, cursor = [], None
+        while True:
+            page, cursor = conversation_page(self.ada, self.bob, before=cursor, page_size=page_size)
+            pages.append([m.id for m in page])
+            if cursor is None:
+                return pages
+            self.assertLess(len(pages), 50)
+
+    def test_pages_cover_everything_once_in_order(self):
+        ids = self.send(7)
+        pages = self.walk(page_size=3)
+        self.assertEqual(pages, [ids[4:], ids[1:4], ids[:1]])
+
+    def test_ties_on_timestamp(self):
+        # Same timestamp for every message: the id decides, nothing is skipped
+        ids = self.send(5, timestamp=timezone.now())
+        pages = self.walk(page_size=2)
+        self.assertEqual([i for page in reversed(pages) for i in page], ids)
+        self.assertEqual(pages, [ids[3:], ids[1:3], ids[:1]])
+
+    def test_ties_across_a_page_boundary(self):
+        older = self.send(2, timestamp=timezone.now() - timedelta(minutes=5))
+        tied = self.send(4, timestamp=timezone.now())
+        pages = self.walk(page_size=3)
+        self.assertEqual([i for page in reversed(pages) for i in page], older + tied)
+
+    def test_last_page_has_no_cursor(self):
+        ids = self.send(4)
+        page, cursor = conversation_page(self.ada, self.bob, page_size=4)
+        self.assertEqual(([m.id for m in page], cursor), (ids, None))
+        page, cursor = conversation_page(self.ada, self.bob, page_size=2)
+        page, cursor = conversation_page(self.ada, self.bob, before=cursor, page_size=2)
+        self.assertEqual(([m.id for m in page], cursor), (ids[:2], None))
+
+    def test_empty_conversation(self):
+        self.assertEqual(conversation_page(self.ada, self.bob), ([], None))
+
+    def test_malformed_cursor_gives_the_newest_page(self):
+        ids = self.send(3)
+        for cursor in ['garbage', '|', 'x|1', '2024-01-01T00:00:00|x', '2024-13-45T00:00:00|1', '1|2|3']:
+            page, _ = conversation_page(self.ada, self.bob, before=cursor, page_size=2)
+            self.assertEqual([m.id for m in page], ids[1:], cursor)
+
+    def test_cursor_round_trip(self):
+        ids = self.send(3)
+        message = DirectMessage.objects.get(id=ids[2])
+        self.assertEqual(decode_cursor(encode_cursor(message)), (message.timestamp, message.id))
+        page, _ = conversation_page(self.ada, self.bob, before=encode_cursor(message))
+        self.assertEqual([m.id for m in page], ids[:2])
+
+
+class MarkReadTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ada, self.bob, self.eve = make_user('ada'), make_user('bob'), make_user('eve')
+        befriend(self.ada, self.bob)
+        self.message = DirectMessage.objects.create(sender=self.bob, receiver=self.ada, message="hi")
+
+    def mark_read(self, reader, other):
+        self.client.force_login(reader.user)
+        return self.client.post(reverse('direct_message_mark_read', args=[other.id]))
+
+    def test_buddy_marks_conversation_read(self):
+        self.assertEqual(self.mark_read(self.ada, self.bob).status_code, 204)
+        self.message.refresh_from_db()
+        self.assertTrue(self.message.is_read)
+
+    def test_non_buddy_gets_404_and_no_receipt(self):
+        DirectMessage.objects.create(sender=self.bob, receiver=self.eve, message="hi")
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.mark_read(self.eve, self.bob)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(DirectMessage.objects.filter(receiver=self.eve, is_read=True).exists())
+        self.assertEqual(callbacks, [])
+
+
+class StudyBuddyPairTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ada, self.bob = make_user('ada'), make_user('bob')
+        self.low, self.high = sorted([self.ada, self.bob], key=lambda profile: profile.id)
+
+    def test_pairs_are_stored_lower_id_first(self):
+        pair = StudyBuddy.objects.create(participant_one=self.high, participant_two=self.low)
+        pair.refresh_from_db()
+        self.assertEqual((pair.participant_one_id, pair.participant_two_id), (self.low.id, self.high.id))
+
+    def test_get_or_create_pair_either_way_round(self):
+        pair, created = StudyBuddy.objects.get_or_create_pair(self.high.id, self.low.id)
+        again, created_again = StudyBuddy.objects.get_or_create_pair(self.low.id, self.high.id)
+        self.assertEqual((pair, created, created_again), (again, True, False))
+        self.assertEqual(BuddyLink.objects.filter(pair=pair).count(), 2)
+
+    def test_constraint_rejects_reversed_and_self_pairs(self):
+        pair = StudyBuddy.objects.create(participant_one=self.low, participant_two=self.high)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StudyBuddy.objects.filter(pk=pair.pk).update(participant_one=self.high, participant_two=self.low)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StudyBuddy.objects.create(participant_one=self.ada, participant_two=self.ada)
+
+    def test_accept_is_idempotent(self):
+        invite = StudyBuddyInvite.objects.create(sender=self.high, receiver=self.low, status='pending')
+        pair = invite.accept()
+        self.assertEqual(invite.accept(), pair)
+        StudyBuddyInvite.objects.get(pk=invite.pk).accept()
+        invite.refresh_from_db()
+        self.assertEqual(invite.status, 'accepted')
+        self.assertEqual(StudyBuddy.objects.count(), 1)
+        self.assertEqual(BuddyLink.objects.count(), 2)
+
+    def test_accept_when_the_pair_already_exists(self):
+        # e.g. both sent an invite and the other one was accepted first
+        existing = StudyBuddy.objects.create(participant_one=self.low, participant_two=self.high)
+        invite = StudyBuddyInvite.objects.create(sender=self.low, receiver=self.high, status='pending')
+        self.assertEqual(invite.accept(), existing)
+        self.assertEqual(StudyBuddy.objects.count(), 1)
+
+    def test_invite_accepted_by_status_save(self):
+        # The admin path: the post_save signal makes the pair, once
+        invite = StudyBuddyInvite.objects.create(sender=self.low, receiver=self.high, status='pending')
+        invite.status = 'accepted'
+        invite.save()
+        invite.save()
+        self.assertEqual(StudyBuddy.objects.count(), 1)
+
+
+class CanonicalPairMigrationTests(TransactionTestCase):
+    before = [('network', '0007_event_audience')]
+    after = [('network', '0009_buddy_links')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes('network'))
+        super().tearDown()
+
+    def test_duplicates_reversed_and_self_pairs_are_merged(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model('auth', 'User')
+        UserProfile = apps.get_model('network', 'UserProfile')
+        StudyBuddy = apps.get_model('network', 'StudyBuddy')
+        a, b, c = [
+            UserProfile.objects.create(
+                user=User.objects.create(username=name), school='circle', major='', year_of_study=1,
+            ).id
+            for name in ['a', 'b', 'c']
+        ]
+        # (participant_one, participant_two) was already unique, not the unordered pair
+        rows = [(a, b), (b, a), (c, b), (a, a), (c, a), (a, c)]
+        ids = [StudyBuddy.objects.create(participant_one_id=one, participant_two_id=two).id for one, two in rows]
+
+        apps = self.migrate(self.after)
+        StudyBuddy = apps.get_model('network', 'StudyBuddy')
+        BuddyLink = apps.get_model('network', 'BuddyLink')
+        stored = sorted(StudyBuddy.objects.values_list('id', 'participant_one_id', 'participant_two_id'))
+        # The oldest row of each unordered pair survives, lower id first
+        self.assertEqual(stored, sorted([
+            (ids[0], a, b),
+            (ids[2], min(b, c), max(b, c)),
+            (ids[4], min(a, c), max(a, c)),
+        ]))
+        self.assertEqual(BuddyLink.objects.count(), 6)
+        self.assertEqual(
+            set(BuddyLink.objects.values_list('owner_id', 'buddy_id')),
+            {(a, b), (b, a), (b, c), (c, b), (a, c), (c, a)},
+        )
+
+
+class RecommendationStalenessTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = Course.objects.create(code='CS101', name='Programming')
+        self.ada, self.bob = make_user('ada'), make_user('bob')
+        for profile in (self.ada, self.bob):
+            profile.set_courses([self.course])
+
+    def compute(self, items):
+        return store_recommendations(items, {}, {})
+
+    def state(self, profile):
+        return RecommendationState.objects.get(user_profile=profile)
+
+    def test_first_run_creates_state_rows(self):
+        items = stale_profiles()
+        self.assertEqual(items, [(self.ada.id, 1), (self.bob.id, 1)])
+        self.assertFalse(self.state(self.ada).is_fresh)
+        self.compute(items)
+        self.assertTrue(self.state(self.ada).is_fresh)
+        self.assertEqual(stale_profiles(), [])
+
+    def test_change_during_first_run_stays_stale(self):
+        items = stale_profiles()
+        mark_users_stale([self.ada.id])  # while ranking
+        self.compute(items)
+        self.assertFalse(self.state(self.ada).is_fresh)
+        self.assertTrue(self.state(self.bob).is_fresh)
+        self.assertEqual([profile_id for profile_id, _ in stale_profiles()], [self.ada.id])
+
+    def test_course_change_is_one_row_until_the_batch_runs(self):
+        self.compute(stale_profiles())
+        versions = dict(RecommendationState.objects.values_list('user_profile_id', 'version'))
+        with self.assertNumQueries(1):
+            mark_courses_stale({self.course.id})
+        mark_courses_stale({self.course.id})
+        self.assertEqual(StaleCourse.objects.count(), 1)
+        self.assertEqual(dict(RecommendationState.objects.values_list('user_profile_id', 'version')), versions)
+
+        # Readers already see the enrollees as stale
+        Recommendation.objects.create(user_profile=self.ada, kind='foaf', rank=0, candidate=self.bob, mutual_ids=[])
+        self.assertIsNone(precomputed_foaf(self.ada, limit=5))
+        StaleCourse.objects.all().delete()
+        self.assertEqual(precomputed_foaf(self.ada, limit=5), [(self.bob.id, [])])
+        mark_courses_stale({self.course.id})
+
+        # The batch job expands it to the enrollees
+        self.assertEqual(sorted(profile_id for profile_id, _ in stale_profiles()), [self.ada.id, self.bob.id])
+        self.assertFalse(StaleCourse.objects.exists())
+
+
+class ThumbnailUrlTests(NetworkTestCase):
+    def test_original_until_the_thumbnails_of_this_picture_exist(self):
+        profile = make_user('ada')
+        profile.profile_pic.name = 'profile_pics/new.png'
+        profile.profile_pic_thumbnails = {'sm': 'profile_pics/thumbs/old-sm.webp', 'source': 'profile_pics/old.png'}
+        self.assertEqual(thumbnail_url(profile, 'sm'), '/media/profile_pics/new.png')
+        profile.profile_pic_thumbnails = {'sm': 'profile_pics/thumbs/new-sm.webp', 'source': 'profile_pics/new.png'}
+        self.assertEqual(thumbnail_url(profile, 'sm'), '/media/profile_pics/thumbs/new-sm.webp')
+
+
+class ConditionalPageTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ada, self.bob, self.eve = make_user('ada'), make_user('bob'), make_user('eve')
+        self.client.force_login(self.ada.user)
+        # The first page sets the CSRF cookie, which is part of the ETag
+        for name in ['profile', 'study_buddies', 'events_page']:
+            self.client.get(reverse(name))
+
+    def etag(self, name):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertChanges(self, name, write, changes=True):
+        before = self.etag(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        after = self.etag(name)
+        if changes:
+            self.assertNotEqual(before, after)
+        else:
+            self.assertEqual(before, after)
+
+    def test_unchanged_page_is_304_without_running_the_view(self):
+        for name in ['profile', 'study_buddies', 'events_page']:
+            response = self.client.get(reverse(name))
+            self.assertIn('private', response['Cache-Control'])
+            with patch('network.views.render') as render:
+                again = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 304, name)
+            render.assert_not_called()
+
+    def test_changed_page_is_rendered(self):
+        etag = self.etag('profile')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ada.bio = "New bio"
+            self.ada.save()
+        response = self.client.get(reverse('profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "New bio")
+
+    def test_profile_page_stamps(self):
+        course = Course.objects.create(code='CS101', name='Programming')
+
+        def edit_profile():
+            self.ada.major = 'Maths'
+            self.ada.save()
+
+        def rename():
+            self.ada.user.username = 'lovelace'
+            self.ada.user.save()
+
+        def rename_course():
+            course.name = 'Programming I'
+            course.save()
+
+        self.assertChanges('profile', edit_profile)
+        self.assertChanges('profile', rename)
+        self.assertChanges('profile', lambda: self.ada.set_courses([course]))
+        self.assertChanges('profile', lambda: UserCourse.objects.filter(user_profile=self.ada).delete())
+        self.assertChanges('profile', lambda: UserCourse.objects.create(user_profile=self.ada, course=course))
+        self.assertChanges('profile', rename_course)
+        self.assertChanges('profile', lambda: self.ada.user.save(update_fields=['last_login']), changes=False)
+        self.assertChanges('profile', lambda: self.eve.save(), changes=False)
+
+    def test_buddies_page_stamps(self):
+        def edit_buddy():
+            self.bob.bio = "Hi"
+            self.bob.save()
+
+        self.assertChanges('study_buddies', lambda: befriend(self.ada, self.bob))
+        self.assertChanges('study_buddies', edit_buddy)
+        self.assertChanges('study_buddies', lambda: self.eve.save(), changes=False)
+        self.assertChanges('study_buddies', lambda: StudyBuddy.objects.pair(self.ada.id, self.bob.id).delete())
+
+    def test_events_page_stamps(self):
+        def create_event():
+            Event.objects.create(
+                organizer=self.bob, title="Revision", description="", date=timezone.localdate() + timedelta(days=1),
+                time='18:00',
+            )
+
+        self.assertChanges('events_page', create_event)
+        self.assertChanges('events_page', lambda: Event.objects.all().delete())
+
+    def test_thumbnails_change_profile_and_buddy_pages(self):
+        befriend(self.ada, self.bob)
+        picture = io.BytesIO()
+        Image.new('RGB', (400, 300), 'teal').save(picture, 'PNG')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch('network.rendering.render_pool.submit') as submit, \
+                patch('network.thumbnails.close_old_connections'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ada.profile_pic = SimpleUploadedFile('ada.png', picture.getvalue())
+                self.ada.save()
+            _, data = submit.call_args.args
+            job, done = submit.call_args.kwargs['func'], submit.call_args.kwargs['on_done']
+
+            bob_client = self.client_class()
+            bob_client.force_login(self.bob.user)
+            bob_client.get(reverse('study_buddies'))  # sets the CSRF cookie
+            buddies = bob_client.get(reverse('study_buddies'))
+            profile = self.client.get(reverse('profile'))
+            self.assertNotContains(profile, '.webp')
+
+            # The render worker finishes after the request that saved the picture
+            done(*job(data))
+            profile = self.client.get(reverse('profile'), HTTP_IF_NONE_MATCH=profile['ETag'])
+            self.assertEqual(profile.status_code, 200)
+            self.assertContains(profile, '.webp')
+            buddies = bob_client.get(reverse('study_buddies'), HTTP_IF_NONE_MATCH=buddies['ETag'])
+            self.assertEqual(buddies.status_code, 200)
+            self.assertContains(buddies, '.webp')
+
+
+class CourseSearchTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        Course.objects.bulk_create([
+            Course(code='CS101', name="Intro to Programming"),
+            Course(code='CS102', name="Data Structures"),
+            Course(code='MATH201', name="Linear Algebra"),
+            Course(code='PHYS101', name="Physics for CS majors"),
+            Course(code='BIO110', name="Cell Biology"),
+        ])
+
+    def codes(self, query, **kwargs):
+        courses, has_next = search_courses(query, **kwargs)
+        return [course.code for course in courses], has_next
+
+    def test_code_prefix_is_case_insensitive(self):
+        self.assertEqual(self.codes('cs1'), (['CS101', 'CS102'], False))
+        self.assertEqual(self.codes('  math'), (['MATH201'], False))
+        # A prefix, not a substring of the code
+        self.assertEqual(self.codes('101'), ([], False))
+
+    def test_name_needs_three_characters(self):
+        self.assertEqual(self.codes('bio'), (['BIO110'], False))
+        self.assertEqual(self.codes('alg'), (['MATH201'], False))
+        self.assertEqual(self.codes('al'), ([], False))
+        self.assertEqual(self.codes(''), ([], False))
+
+    def test_code_matches_come_first(self):
+        # ABC100 only matches by name, so it sorts after BIO110 and BIO300
+        Course.objects.create(code='ABC100', name="Biology lab")
+        Course.objects.create(code='BIO300', name="Genetics")
+        self.assertEqual(self.codes('bio'), (['BIO110', 'BIO300', 'ABC100'], False))
+
+    def test_pages(self):
+        Course.objects.bulk_create(Course(code=f'CS2{i:02}', name="Seminar") for i in range(5))
+        self.assertEqual(self.codes('cs', page_size=3), (['CS101', 'CS102', 'CS200'], True))
+        self.assertEqual(self.codes('cs', page=2, page_size=3), (['CS201', 'CS202', 'CS203'], True))
+        self.assertEqual(self.codes('cs', page=3, page_size=3), (['CS204'], False))
+        self.assertEqual(self.codes('cs', page=4, page_size=3), ([], False))
+
+    def test_endpoint(self):
+        self.client.force_login(make_user('ada').user)
+        response = self.client.get(reverse('course_search'), {'q': 'cs', 'page_size': 1})
+        self.assertEqual(response.json(), {
+            'results': [{'id': Course.objects.get(code='CS101').id, 'code': 'CS101',
+                         'name': "Intro to Programming", 'label': "CS101 - Intro to Programming"}],
+            'page': 1,
+            'has_next': True,
+        })
+        response = self.client.get(reverse('course_search'), {'q': 'cs', 'page': 'two'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_endpoint_needs_login(self):
+        response = self.client.get(reverse('course_search'), {'q': 'cs'})
+        self.assertEqual(response.status_code, 302)
+
+
+class ProfileFormCourseTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.courses = Course.objects.bulk_create(Course(code=f'CS{i:03}', name=f"Course {i}") for i in range(30))
+        self.profile = make_user('ada', school='circle', major="CS", year_of_study=2)
+
+    def form(self, course_ids):
+        data = {'school': 'circle', 'major': "CS", 'year_of_study': 2, 'study_style': 'mixed',
+                'enrolled_courses': course_ids}
+        return UserProfileForm(data, instance=self.profile)
+
+    def test_accepts_submitted_ids(self):
+        form = self.form([self.courses[3].id, self.courses[7].id])
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(set(form.cleaned_data['enrolled_courses']), {self.courses[3], self.courses[7]})
+
+    def test_looks_up_only_submitted_ids(self):
+        form = self.form([self.courses[3].id])
+        with self.assertNumQueries(1) as queries:
+            form.fields['enrolled_courses'].clean([str(self.courses[3].id)])
+        self.assertIn(str(self.courses[3].id), queries.captured_queries[0]['sql'])
+
+    def test_rejects_unknown_ids(self):
+        for value in [[0], ['CS003']]:
+            with self.subTest(value=value):
+                form = self.form(value)
+                self.assertFalse(form.is_valid())
+                self.assertIn('enrolled_courses', form.errors)
+
+    def test_renders_only_selected_courses(self):
+        UserCourse.objects.create(user_profile=self.profile, course=self.courses[5])
+        html = str(UserProfileForm(instance=self.profile)['enrolled_courses'])
+        self.assertEqual(html.count('<option'), 1)
+        self.assertIn(f'value="{self.courses[5].id}" selected', html)
+        self.assertIn(f'data-search-url="{reverse("course_search")}"', html)
+
+
+class GraphDataDeltaTests(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ada, self.bob, self.cat, self.dan = [make_user(name) for name in ['ada', 'bob', 'cat', 'dan']]
+        befriend(self.ada, self.bob)
+        befriend(self.bob, self.cat)
+        self.client.force_login(self.ada.user)
+
+    def fetch(self, scope='user', since=None):
+        params = {'scope': scope}
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(reverse('study_graph_data'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def state(self, data):
+        return {
+            'version': data['version'],
+            'nodes': {node['id']: node for node in data['nodes']},
+            'edges': {(edge['source'], edge['target']): edge for edge in data['edges']},
+        }
+
+    def apply(self, state, data):
+        # What a client does with a response
+        if data['mode'] == 'full':
+            return self.state(data)
+        nodes, edges = dict(state['nodes']), dict(state['edges'])
+        for node in data['removed_nodes']:
+            nodes.pop(node, None)
+            edges = {key: edge for key, edge in edges.items() if node not in key}
+        for source, target in data['removed_edges']:
+            edges.pop((source, target), None)
+        nodes.update((node['id'], node) for node in data['nodes'])
+        edges.update(((edge['source'], edge['target']), edge) for edge in data['edges'])
+        return {'version': data['version'], 'nodes': nodes, 'edges': edges}
+
+    def assertDeltaMatches(self, write, scope='user'):
+        state = self.state(self.fetch(scope))
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        delta = self.fetch(scope, since=state['version'])
+        self.assertEqual(delta['mode'], 'delta')
+        self.assertEqual(self.apply(state, delta), self.state(self.fetch(scope)))
+
+    def invite(self):
+        return StudyBuddyInvite.objects.create(sender=self.ada, receiver=self.cat, status='pending')
+
+    def test_delta_after_invite_accept_remove_and_rename(self):
+        for scope in ['user', 'network']:
+            with self.subTest(scope=scope):
+                StudyBuddyInvite.objects.all().delete()
+                StudyBuddy.objects.pair(self.ada.id, self.cat.id).delete()
+                self.assertDeltaMatches(self.invite, scope)
+                self.assertDeltaMatches(lambda: StudyBuddyInvite.objects.get(sender=self.ada).accept(), scope)
+                self.assertDeltaMatches(lambda: StudyBuddy.objects.pair(self.ada.id, self.bob.id).delete(), scope)
+                self.assertDeltaMatches(lambda: befriend(self.ada, self.bob), scope)
+
+                def rename():
+                    user = User.objects.get(pk=self.bob.user_id)
+                    user.username = f'bob-{scope}'
+                    user.save()
+                self.assertDeltaMatches(rename, scope)
+
+    def test_delta_over_several_changes(self):
+        state = self.state(self.fetch())
+        with self.captureOnCommitCallbacks(execute=True):
+            invite = self.invite()
+        with self.captureOnCommitCallbacks(execute=True):
+            invite.accept()
+        with self.captureOnCommitCallbacks(execute=True):
+            StudyBuddy.objects.pair(self.ada.id, self.bob.id).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dan.user.username = 'daniel'
+            self.dan.user.save()
+        delta = self.fetch(since=state['version'])
+        self.assertEqual(delta['mode'], 'delta')
+        # bob left ada's view; cat joined it
+        self.assertIn(self.bob.id, delta['removed_nodes'])
+        self.assertEqual(self.apply(state, delta), self.state(self.fetch()))
+
+    def test_unchanged_since_is_an_empty_delta(self):
+        version = self.fetch()['version']
+        delta = self.fetch(since=version)
+        self.assertEqual((delta['mode'], delta['nodes'], delta['edges']), ('delta', [], []))
+
+    def test_unusable_since_falls_back_to_full(self):
+        version = self.fetch()['version']
+        self.assertEqual(self.fetch(since=version + 10)['mode'], 'full')
+        self.assertEqual(self.fetch(since=version - 10)['mode'], 'full')
+        self.assertEqual(self.fetch(since='yesterday')['mode'], 'full')
+        # Another process changed the graph: the change log is gone
+        study_graph.invalidate()
+        self.assertEqual(self.fetch(since=version)['mode'], 'full')
+
+    def test_log_shorter_than_the_gap_falls_back_to_full(self):
+        version = self.fetch()['version']
+        with patch.object(study_graph, '_changes', deque(maxlen=2)):
+            for _ in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.invite().delete()
+            self.assertEqual(self.fetch(since=version)['mode'], 'full')
+            self.assertEqual(self.fetch(since=study_graph.current_version() - 1)['mode'], 'delta')
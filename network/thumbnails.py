@@ -0,0 +1,174 @@
+import hashlib
+import io
+import logging
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+# network/thumbnails.py
+#
+# Profile picture derivatives. Uploads are kept as they are, and small
+# square WebP copies are made in a few sizes after a picture is saved, in a
+# render worker (see UserProfile.save()); the original is served until they
+# are ready. Each copy is named after a hash of the original's bytes, so a
+# name never points at different content and the thumbnail view can tell
+# browsers to cache it for a year.
+#
+#   profile_pics/thumbs/<sha256 of original, 16 hex>-<size>.webp
+#
+# The default picture's copies are made by `manage.py generate_thumbnails`;
+# run it on deploy, before starting the server.
+
+THUMBNAIL_SIZES = {
+    'sm': 64,    # cards (64px in base.html)
+    'md': 128,   # cards on high-density screens
+    'lg': 256,   # profile page
+}
+THUMBNAIL_DIR = 'profile_pics/thumbs'
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_AGE = 60 * 60 * 24 * 365
+
+DEFAULT_PIC = 'profile_pics/default.png'
+
+logger = logging.getLogger(__name__)
+
+_default_lock = threading.Lock()
+_default_thumbnails = None
+
+
+def thumbnail_name(digest, size):
+    return f'{THUMBNAIL_DIR}/{digest}-{size}.webp'
+
+
+def render_thumbnail(image, pixels):
+    """``image`` cropped to a centred square and scaled to ``pixels``, as WebP bytes."""
+    from PIL import Image, ImageOps
+
+    image = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, 'WEBP', quality=THUMBNAIL_QUALITY, method=6)
+    return out.getvalue()
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def render_thumbnails_job(data):
+    """
+    ``(digest, {size: WebP bytes})`` for the image bytes ``data``, with no
+    sizes if Pillow cannot read them. Plain data in and out, so it can run
+    in a render worker (network/rendering.py).
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    digest = _digest(data)
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError):
+        return digest, {}
+    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    return digest, {size: render_thumbnail(image, pixels) for size, pixels in THUMBNAIL_SIZES.items()}
+
+
+def save_thumbnails(digest, images):
+    """Store rendered ``images`` that are not stored yet; returns {size: storage name}."""
+    names = {size: thumbnail_name(digest, size) for size in images}
+    for size, name in names.items():
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(images[size]))
+    return names
+
+
+def make_thumbnails(file):
+    """
+    Write the derivatives of an image file (anything with read()) and return
+    {size: storage name}. Files that already exist are not written again.
+    Returns {} if the file is not an image Pillow can read.
+    """
+    file.seek(0)
+    data = file.read()
+    names = {size: thumbnail_name(_digest(data), size) for size in THUMBNAIL_SIZES}
+    if all(default_storage.exists(name) for name in names.values()):
+        return names
+    digest, images = render_thumbnails_job(data)
+    return save_thumbnails(digest, images)
+
+
+def queue_thumbnails(profile_id, source):
+    """
+    Make the derivatives of the stored picture ``source`` in a render worker
+    and record them on the profile, if it still has that picture, when done.
+    """
+    from .conditional import profile_pages_changed
+    from .models import UserProfile
+    from .rendering import RenderQueueFull, render_pool
+
+    try:
+        with default_storage.open(source) as file:
+            data = file.read()
+    except OSError:
+        return
+
+    def done(digest, images):
+        # Runs on the pool's callback thread, with its own connection
+        try:
+            thumbnails = {**save_thumbnails(digest, images), 'source': source}
+            if UserProfile.objects.filter(pk=profile_id, profile_pic=source).update(profile_pic_thumbnails=thumbnails):
+                # update() sends no post_save; the pages still show the original
+                profile_pages_changed(profile_id)
+        except Exception:
+            logger.exception("Storing thumbnails of %s failed", source)
+        finally:
+            close_old_connections()
+
+    try:
+        render_pool.submit(f'thumbnails:{profile_id}:{source}', data, on_done=done, func=render_thumbnails_job)
+    except RenderQueueFull:
+        # The original is served meanwhile; generate_thumbnails catches up
+        logger.warning("Render queue full; thumbnails of %s left for generate_thumbnails", source)
+
+
+def make_default_thumbnails():
+    global _default_thumbnails
+    with default_storage.open(DEFAULT_PIC) as file:
+        names = make_thumbnails(file)
+    with _default_lock:
+        _default_thumbnails = names
+    return names
+
+
+def default_thumbnails():
+    # Looked up once per process, never written here: this runs while
+    # templates render. {} (the original is served) if they were not made.
+    global _default_thumbnails
+    with _default_lock:
+        if _default_thumbnails is None:
+            try:
+                with default_storage.open(DEFAULT_PIC) as file:
+                    digest = _digest(file.read())
+            except OSError:
+                _default_thumbnails = {}
+            else:
+                names = {size: thumbnail_name(digest, size) for size in THUMBNAIL_SIZES}
+                found = all(default_storage.exists(name) for name in names.values())
+                _default_thumbnails = names if found else {}
+        return _default_thumbnails
+
+
+def thumbnail_url(user_profile, size):
+    """URL of ``user_profile``'s picture at ``size``, falling back to the original."""
+    if user_profile.profile_pic:
+        thumbnails = user_profile.profile_pic_thumbnails
+        if thumbnails.get('source') != user_profile.profile_pic.name:
+            thumbnails = {}  # still being made
+    else:
+        thumbnails = default_thumbnails()
+    name = thumbnails.get(size)
+    if name is None:
+        return user_profile.profile_pic_url
+    return settings.MEDIA_URL + name
@@ -1,13 +1,15 @@
-from django.urls import path
+from django.urls import path, re_path
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 from django.conf.urls.static import static
 from . import views
+from .thumbnails import THUMBNAIL_DIR
 
 urlpatterns = [
     path('', views.home, name='home'),
 
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/', views.dashboard_async if settings.NETWORK_ASYNC_DASHBOARD else views.dashboard,
+         name='dashboard'),
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='network/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='/'), name='logout'),
@@ -19,12 +21,22 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
     path('profile/study_buddies/', views.view_study_buddies, name='study_buddies'),
+    path('courses/search/', views.course_search, name='course_search'),
 
     path('direct_messages/', views.direct_message_inbox, name='direct_message_inbox'),
+    path('direct_messages/<int:buddy_id>/', views.direct_message_conversation, name='direct_message_conversation'),
+    path('direct_messages/<int:buddy_id>/read/', views.direct_message_mark_read, name='direct_message_mark_read'),
+    path('direct_messages/stream/', views.direct_message_stream, name='direct_message_stream'),
     path('events/', views.events_page, name='events_page'),
 
     path('study_graph/', views.study_graph, name='study_graph'),
     path('study_graph/image/', views.study_graph_image, name='study_graph_image'),
+    path('study_graph/data/', views.study_graph_data, name='study_graph_data'),
+    path('metrics/', views.network_metrics, name='network_metrics'),
+
+    # Before the plain media route below, so thumbnails get long cache headers
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}{THUMBNAIL_DIR}/(?P<name>[0-9a-f]{{16}}-[a-z]{{2}}\.webp)$',
+            views.profile_pic_thumbnail, name='profile_pic_thumbnail'),
 
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
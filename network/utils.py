@@ -1,192 +1,200 @@
+import logging
+
+from django.core.cache import cache
+from django.db import connection
 from django.db.models import Q, Count
 from datetime import timedelta
 
-from networkx.drawing import spring_layout
-
-from .models import UserProfile, StudyBuddyInvite, StudyBuddy
-
-import networkx as nx
-import matplotlib.pyplot as plt
+from .events import get_event_participants
+from .graph_store import build_graph
+from .instrumentation import incr, sampled, span
+from .models import UserProfile, StudyBuddyInvite, StudyBuddy, BuddyLink, UserCourse, Course, mask_to_weekdays
+from .suggestion_index import suggestion_index, styles_compatible
 
 # network/utils.py
 
-def build_study_network_graph():
-    G = nx.Graph()
-    # Add nodes for all users
-    users = UserProfile.objects.all()
-    for user in users:
-        G.add_node(user.id, label=user.user.username)
+logger = logging.getLogger(__name__)
 
 
-    # Add edges from study sessions (accepted connections)
-    study_buddies = StudyBuddy.objects.all()
-    for study_buddy in study_buddies:
-        G.add_edge(study_buddy.participant_one.id, study_buddy.participant_two.id, type='study_buddy')
-
-    # Add directed edges for all invites (optional: only show pending or all)
-    invites = StudyBuddyInvite.objects.all()
-    for invite in invites:
-        G.add_edge(invite.sender.id, invite.receiver.id, type='invite', status=invite.status)
+def build_study_network_graph():
+    # Full rebuild straight from the database. Request handlers should read
+    # the long-lived graph from graph_store.study_graph instead.
+    with span('graph.build'):
+        G = build_graph()
 
-    print(f"Graph nodes: {G.nodes}")
-    print(f"Graph edges: {G.edges}")
+    if sampled(logger):
+        logger.debug("Study graph: %d nodes, %d edges", G.number_of_nodes(), G.number_of_edges())
     return G
 
 
 
-def draw_study_network_graph(G, user_node=None, buddy_nodes=None, recommendation_nodes=None):
-    if buddy_nodes is None:
-        buddy_nodes = []
-    if recommendation_nodes is None:
-        recommendation_nodes = []
-
-    pos = nx.spring_layout(G)
-    node_colors = []
-    for n in G.nodes():
-        if str(n) == str(user_node):
-            node_colors.append('#FFD600')     # Gold for user
-        elif str(n) in [str(b) for b in buddy_nodes]:
-            node_colors.append('#1976d2')     # Blue for buddies
-        elif str(n) in [str(r) for r in recommendation_nodes]:
-            node_colors.append('#FFAB40')     # Faint orange for recommendations
-        else:
-            node_colors.append('lightgray')
-
-    edge_colors = ['green' if d.get('type') == 'session' else 'blue' for _, _, d in G.edges(data=True)]
-    nx.draw(
-        G, pos=spring_layout(G, k=0.8),
-        with_labels=True, labels=nx.get_node_attributes(G, 'label'),
-        edge_color=edge_colors,
-        node_size=800,
-        node_color=node_colors,
-        linewidths=2,
-        edgecolors='black'
-    )
-    plt.tight_layout()
-
-def get_suggested_study_buddies(user_profile):
-    print("=" * 40)
-    print(f"Debug for get_suggested_study_buddies for user {user_profile} (id={user_profile.id})")
-
-    # Exclude users already invited or connected
-    excluded_ids = set(
-        StudyBuddyInvite.objects.filter(sender=user_profile).values_list('receiver_id', flat=True)
-    ).union(
-        StudyBuddyInvite.objects.filter(receiver=user_profile).values_list('sender_id', flat=True)
-    )
-    excluded_ids.add(user_profile.id)
-    print(f"Excluded user IDs (already invited or self): {excluded_ids}")
-
-    # Find users sharing at least one course
-    shared_course_users = UserProfile.objects \
-        .filter(courses__in=user_profile.courses.all()) \
-        .exclude(id__in=excluded_ids) \
-        .distinct()
-
-    print(f"Found {shared_course_users.count()} users sharing courses with you:")
+# Node positions are cached per graph version. When the graph changes, the
+# new layout starts from the previous positions, so it needs far fewer
+# iterations and the picture does not jump around between versions.
+LAYOUT_CACHE_KEY = 'network:graph_layout'
+LAYOUT_ITERATIONS = 50
+LAYOUT_WARM_START_ITERATIONS = 15
 
-    compatible_days = UserProfile.objects \
-        .filter(available_weekdays__overlap=user_profile.available_weekdays) \
-        .exclude(id__in=excluded_ids) \
-        .distinct()
 
-    print(f"Your availability days: {len(compatible_days)}")
+def plan_study_graph_layout(G, version):
+    # (pos, initial_pos, iterations): ``pos`` is set when the cached layout
+    # is current; otherwise the render worker lays out from ``initial_pos``.
+    cached = cache.get(LAYOUT_CACHE_KEY)
+    if cached is None:
+        return None, None, LAYOUT_ITERATIONS
+    previous = cached['pos']
+    if cached['version'] == version and len(previous) == len(G):
+        return previous, None, LAYOUT_ITERATIONS
 
-    shared_course_ids = set(shared_course_users.values_list("id", flat=True))
-    compatible_day_ids = set(compatible_days.values_list("id", flat=True))
-    matching_user_ids = shared_course_ids & compatible_day_ids
+    initial_pos = {n: previous[n] for n in G if n in previous}
+    # Drop new nodes next to a neighbour that already has a position
+    for n in G:
+        if n not in initial_pos:
+            placed = [previous[m] for m in G.neighbors(n) if m in previous]
+            if placed:
+                initial_pos[n] = placed[0]
+    return None, initial_pos, LAYOUT_WARM_START_ITERATIONS
 
-    matches = UserProfile.objects.filter(id__in=matching_user_ids)
 
-    my_courses = set(c.code for c in user_profile.courses.all())
-    my_days = set(user_profile.available_weekdays)
-
-    suggestions = []
-
-    for other_user_profile in matches:
-        if not compatible_styles(user_profile, other_user_profile):
-            print("    Skipped: Incompatible study styles.")
-            continue
+def store_study_graph_layout(version, pos):
+    cache.set(LAYOUT_CACHE_KEY, {'version': version, 'pos': pos}, timeout=None)
 
+def rank_suggestions(user_profile, limit=None, offset=0):
+    # Ranked suggestions from the in-memory course/weekday index: everyone
+    # sharing a course and a weekday with a compatible study style, as
+    # [(profile_id, score, shared_course_ids, shared_weekdays_mask), ...]
+    # Exclude users already invited or connected
+    with span('suggestions.exclusions'):
+        excluded_ids = {user_profile.id}
+        invites = StudyBuddyInvite.objects.filter(Q(sender=user_profile) | Q(receiver=user_profile))
+        for sender_id, receiver_id in invites.values_list('sender_id', 'receiver_id'):
+            excluded_ids.update((sender_id, receiver_id))
+
+    with span('suggestions.rank'):
+        ranked = suggestion_index.rank(user_profile, excluded_ids=excluded_ids, limit=limit, offset=offset)
+
+    if sampled(logger):
+        logger.debug(
+            "Suggestions for profile %s: excluded %s, returned %s",
+            user_profile.id, sorted(excluded_ids), [(profile_id, score) for profile_id, score, *_ in ranked],
+        )
+    return ranked
+
+
+def hydrate_suggestions(ranked):
+    # Profiles and courses for rank_suggestions() output, in two queries.
+    # Rows whose profile has gone since ranking are skipped.
+    if not ranked:
+        return []
+    with span('suggestions.hydrate'):
+        profiles = UserProfile.objects.select_related('user').in_bulk([profile_id for profile_id, *_ in ranked])
+        courses = Course.objects.in_bulk({course_id for _, _, course_ids, _ in ranked for course_id in course_ids})
+
+        suggestions = []
+        for profile_id, score, shared_course_ids, shared_mask in ranked:
+            if profile_id not in profiles:
+                continue
+            suggestions.append({
+                "profile": profiles[profile_id],
+                "shared_courses": sorted(
+                    (courses[course_id] for course_id in shared_course_ids if course_id in courses),
+                    key=lambda c: c.code,
+                ),
+                "shared_days": mask_to_weekdays(shared_mask),
+                "score": score,
+            })
+    return suggestions
 
-        shared_courses = other_user_profile.courses.filter(id__in=user_profile.courses.values_list('id', flat=True))
-        shared_days = list(set(user_profile.available_weekdays) & set(other_user_profile.available_weekdays))
-        study_style = ""
-        suggestions.append({
-            "profile": other_user_profile,
-            "shared_courses": shared_courses,
-            "shared_days": shared_days,
-        })
 
+def get_suggested_study_buddies(user_profile, limit=None, offset=0):
+    return hydrate_suggestions(rank_suggestions(user_profile, limit=limit, offset=offset))
+
+
+# Friends-of-friends straight from the buddy links: one statement finds the
+# candidates, their mutual buddies and the ranking, whatever the user's degree.
+FOAF_SQL = """
+WITH buddies AS (
+    SELECT buddy_id FROM {link} WHERE owner_id = %(user_id)s
+),
+links AS (
+    SELECT b.buddy_id, l.buddy_id AS foaf_id
+    FROM buddies b JOIN {link} l ON l.owner_id = b.buddy_id
+)
+SELECT foaf_id, ARRAY_AGG(buddy_id ORDER BY buddy_id) AS mutual_ids
+FROM links
+WHERE foaf_id <> %(user_id)s
+  AND foaf_id NOT IN (SELECT buddy_id FROM buddies)
+  AND foaf_id NOT IN (SELECT receiver_id FROM {invite} WHERE sender_id = %(user_id)s)
+  AND foaf_id NOT IN (SELECT sender_id FROM {invite} WHERE receiver_id = %(user_id)s)
+GROUP BY foaf_id
+ORDER BY COUNT(*) DESC, foaf_id
+LIMIT %(limit)s
+"""
+
+
+def rank_foaf_candidates(user_profile, limit=None):
+    # [(foaf_id, [mutual buddy ids]), ...] ranked by number of mutual buddies.
+    # Users already invited either way (pending or rejected) are left out.
+    sql = FOAF_SQL.format(
+        link=BuddyLink._meta.db_table,
+        invite=StudyBuddyInvite._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'user_id': user_profile.id, 'limit': limit})
+        return [(foaf_id, list(mutual_ids)) for foaf_id, mutual_ids in cursor.fetchall()]
 
-    print(f"\nTotal suggestions made: {len(suggestions)}")
-    for suggestion in suggestions:
-        print(f"Study buddy suggestions: {suggestion['profile'].user.username} - courses: {suggestion['shared_courses']}, days: {suggestion['shared_days']}")
 
-    return suggestions
+def get_foaf_recommendations(user_profile, limit=None):
+    with span('foaf.rank'):
+        ranked = rank_foaf_candidates(user_profile, limit=limit)
+    incr('foaf.candidates', len(ranked))
+    return hydrate_foaf_recommendations(user_profile, ranked)
 
 
-def get_foaf_recommendations(user_profile):
-    G = build_study_network_graph()
-    user_id = user_profile.id
-    if user_id not in G:
+def hydrate_foaf_recommendations(user_profile, ranked):
+    # Profiles, mutual buddies and courses for rank_foaf_candidates() output,
+    # in two queries. Candidates whose profile has gone are skipped.
+    if not ranked:
         return []
 
-    # Get direct buddies
-    direct_buddies = set(G.neighbors(user_id))
-    print(f"User {user_profile} (id={user_id}) has {len(direct_buddies)} direct buddies.")
-    print(f"Direct buddies: {direct_buddies}")
-
-    # To keep only "first instance" of each FOAF, use a set to mark collected
-    foafs = []
-    seen = set()
-    for buddy_id in direct_buddies:
-        for foaf_id in G.neighbors(buddy_id):
-            if (
-                foaf_id != user_id and                 # not self
-                foaf_id not in direct_buddies and      # not a direct buddy
-                foaf_id not in seen                    # not already collected via another buddy
-            ):
-                seen.add(foaf_id)
-                mutual_buddies_ids = direct_buddies.intersection(G.neighbors(foaf_id))
-                # Retrieve usernames for mutual buddies
-                mutual_buddies = UserProfile.objects.filter(id__in=mutual_buddies_ids).select_related("user")
-                buddy_names = [b.user.username for b in mutual_buddies]
-                # Accumulate all data as a dictionary
-
-                foafs.append({
-                    "id": foaf_id,
-                    "buddy_names": buddy_names,
-                    "name": UserProfile.objects.get(id=foaf_id).user.username,
-                })
-
-                print(f"Added FOAF: {foaf_id} via buddy {buddy_id}")
-
-    # Exclude users already invited (pending/rejected)
-    invited_ids = set(
-        user_profile.sent_invites.values_list('receiver_id', flat=True)
-    ).union(
-        user_profile.received_invites.values_list('sender_id', flat=True)
-    )
-
-    # Filter out those already invited
-    foafs = [foaf for foaf in foafs if foaf["id"] not in invited_ids]
-
-    print(f"Final FOAF: {foafs} ")
+    with span('foaf.hydrate'):
+        foaf_ids = [foaf_id for foaf_id, _ in ranked]
+        mutual_ids = {buddy_id for _, ids in ranked for buddy_id in ids}
+        profiles = UserProfile.objects.select_related('user').in_bulk(set(foaf_ids) | mutual_ids)
+
+        # Courses for every candidate and for the user, in one query
+        courses_by_profile = {}
+        enrollments = UserCourse.objects \
+            .filter(user_profile_id__in=foaf_ids + [user_profile.id]) \
+            .select_related('course') \
+            .order_by('course__name')
+        for enrollment in enrollments:
+            courses_by_profile.setdefault(enrollment.user_profile_id, []).append(enrollment.course)
+        my_course_ids = {course.id for course in courses_by_profile.get(user_profile.id, [])}
+
+        foafs = []
+        for foaf_id, buddy_ids in ranked:
+            if foaf_id not in profiles:
+                continue
+            buddy_ids = [buddy_id for buddy_id in buddy_ids if buddy_id in profiles]
+            courses = courses_by_profile.get(foaf_id, [])
+            foafs.append({
+                "id": foaf_id,
+                "name": profiles[foaf_id].user.username,
+                "profile": profiles[foaf_id],
+                "buddy_names": [profiles[buddy_id].user.username for buddy_id in buddy_ids],
+                "mutual_count": len(buddy_ids),
+                "courses": courses,
+                "shared_courses": [course for course in courses if course.id in my_course_ids],
+            })
+
+    if sampled(logger):
+        logger.debug(
+            "FOAF for profile %s: %s",
+            user_profile.id, [(f['id'], f['mutual_count']) for f in foafs],
+        )
     return foafs
 
 def compatible_styles(user1, user2):
     # Match if same style or either is 'mixed'
-    return (
-        user1.study_style == user2.study_style
-        or user1.study_style == 'mixed'
-        or user2.study_style == 'mixed'
-    )
-
-def get_event_participants(event):
-    qs = UserProfile.objects.all()
-    if event.target_school:
-        qs = qs.filter(school=event.target_school)
-    if event.target_major:
-        qs = qs.filter(major=event.target_major)
-    return qs
+    return styles_compatible(user1.study_style, user2.study_style)
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+# network/versioning.py
+#
+# Shared version counters. They live in the Django cache, so with a shared
+# backend (Redis, Memcached) every worker process sees the same numbers and
+# can tell when another process changed something. With the default
+# local-memory cache they are simply per-process.
+
+VERSION_KEY_PREFIX = 'network:version:'
+
+
+def _version_key(name):
+    return VERSION_KEY_PREFIX + name
+
+
+def _initial_version():
+    # Seed new counters from the clock so a counter that was evicted and
+    # re-created never hands out a number that was already used before.
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(names):
+    # {name: version} in one cache round trip; missing counters are created
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for name in names:
+        if name not in versions:
+            versions[name] = get_version(name)
+    return versions
+
+
+def bump_version(name):
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Counter missing (never created or evicted)
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.incr(key)
+
+
+class VersionedStore:
+    """
+    In-process data built once from the database and kept current by deltas.
+
+    Every delta that changes something bumps the shared version
+    ``version_name``. A process that sees the shared version move without
+    having applied the change itself (another worker wrote it) reloads on
+    its next read.
+    """
+    version_name = None
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._data = None
+        self._stale = False
+        self.version = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def _current(self):
+        # Caller must hold self.lock
+        shared_version = get_version(self.version_name)
+        if self._data is None or self._stale or shared_version != self.version:
+            self._data = self.load()
+            self._stale = False
+            self.version = shared_version
+        return self._data
+
+    def current_version(self):
+        with self.lock:
+            self._current()
+            return self.version
+
+    def invalidate(self):
+        with self.lock:
+            self._stale = True
+        bump_version(self.version_name)
+
+    def _apply(self, change):
+        # Returns what ``change`` returned, or None if nothing was loaded yet.
+        # A falsy result means nothing changed and keeps the version; with
+        # nothing loaded we can't tell, so the version always moves then.
+        result = None
+        with self.lock:
+            if self._data is not None and not self._stale:
+                result = change(self._data)
+                if not result:
+                    return result
+            new_version = bump_version(self.version_name)
+            if self.version is not None and new_version == self.version + 1:
+                self.version = new_version
+            else:
+                # Someone else changed the data since our last sync
+                self._stale = True
+        return result
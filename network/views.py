@@ -2,16 +2,42 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_POST
 from django.db.models import Q
-from django.http import HttpResponse
-
-
-import io
-from .models import UserProfile, StudyBuddyInvite, StudyBuddy, WEEKDAY_CHOICES, SCHOOL_CHOICES, UserCourse, DirectMessage, Event
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.core.cache import cache
+from django.conf import settings
+
+
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .models import UserProfile, StudyBuddyInvite, BuddyLink, SCHOOL_CHOICES, Event
+from .conditional import (
+    COURSES_PAGE_STAMP, EVENTS_PAGE_STAMP, buddies_page_stamp, conditional_page, etag_for,
+    not_modified, profile_page_stamp, set_validators,
+)
+from .courses import COURSE_SEARCH_MAX_PAGE_SIZE, COURSE_SEARCH_PAGE_SIZE, search_courses
+from .dashboard import abuild_dashboard_context, build_dashboard_context
+from .events import upcoming_events_page
+from .instrumentation import incr, metrics_snapshot, span
 from .forms import UserProfileForm, RegisterForm, DirectMessageForm
-from .utils import build_study_network_graph, draw_study_network_graph, get_suggested_study_buddies, get_foaf_recommendations
+from .graph_data import graph_data, recommendations_for, stream_graph_data
+from .graph_store import study_graph as study_graph_store
+from .messaging import inbox_summary, are_buddies, conversation_page, mark_conversation_read, message_event
+from .pubsub import get_broker, user_channel
+from .suggestion_index import suggestion_index
+from .thumbnails import THUMBNAIL_DIR, THUMBNAIL_MAX_AGE
+from .rendering import RenderQueueFull, graph_render_job, render_pool
+from .utils import LAYOUT_ITERATIONS, plan_study_graph_layout, store_study_graph_layout
 
+logger = logging.getLogger(__name__)
 
 
 def home(request):
@@ -26,109 +52,95 @@ def register(request):
             user = form.save()
             school = form.cleaned_data.get("school")
             major = form.cleaned_data.get("major")
-            # Fill UserProfile with extra fields
-            UserProfile.objects.filter(user=user).update(school=school, major=major)
+            # Fill UserProfile with extra fields (through save() so the
+            # suggestion index and graph hear about it)
+            profile = user.userprofile
+            profile.school = school
+            profile.major = major
+            profile.save(update_fields=['school', 'major'])
             login(request, user)
             return redirect("dashboard")
     else:
         form = RegisterForm()
     return render(request, "network/register.html", {"form": form})
 
-@login_required
-def dashboard(request):
-    user_profile, created = UserProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            "school": "",
-            "major": "",
-            "year_of_study": 1
-        }
-    )
 
-    if not user_profile.courses or not user_profile.available_weekdays:
-        messages.warning(request, "Please complete your profile to get better suggestions.")
+DASHBOARD_PROFILE_DEFAULTS = {
+    "school": "",
+    "major": "",
+    "year_of_study": 1
+}
 
-    weekday_labels = dict(WEEKDAY_CHOICES)
-    user_days = set(user_profile.available_weekdays)
-    user_courses = set(user_profile.courses.values_list('id', flat=True))
-    suggestions = get_suggested_study_buddies(user_profile)
 
-    # Get pending outgoing invites (sent but not accepted yet)
-    outgoing_invites = StudyBuddyInvite.objects.filter(
-        sender=user_profile,
-        status='pending'
-    ).select_related('receiver')
+def _dashboard_page(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
 
 
-    for suggestion in suggestions:
-        profile = suggestion['profile']
-        #print(f"DEBUG: Profile {profile} — id={profile.id} -weekdays{weekdays}")
+def _dashboard_response(request, context):
+    if not context['profile_complete']:
+        messages.warning(request, "Please complete your profile to get better suggestions.")
 
-    foaf_dicts = get_foaf_recommendations(user_profile)
-    foaf_profiles = UserProfile.objects.filter(id__in=[foaf["id"] for foaf in foaf_dicts]).select_related("user")
-    profiles_by_id = {profile.id: profile for profile in foaf_profiles}
+    response = render(request, 'network/dashboard.html', context)
+    if settings.DEBUG:
+        response['X-Query-Count'] = str(context['query_count'])
+    return response
 
 
+@login_required
+def dashboard(request):
+    user_profile, created = UserProfile.objects.get_or_create(
+        user=request.user,
+        defaults=DASHBOARD_PROFILE_DEFAULTS,
+    )
+    context = build_dashboard_context(user_profile, page=_dashboard_page(request))
+    return _dashboard_response(request, context)
 
-    # Attach both profile and buddy_names as an object you can use in template
-    foaf_suggestions = []
-    for foaf in foaf_dicts:
-        profile = profiles_by_id.get(foaf["id"])
-        if profile:
-            profile.buddy_names = foaf["buddy_names"]
-            profile.course_names = [uc.course.name for uc in profile.usercourse_set.select_related('course').all()]
-            profile.available_days = profile.available_weekdays  # if you want to rename for template
 
-            foaf_course_qs = profile.courses.all()
-            foaf_course_ids = set(foaf_course_qs.values_list('id', flat=True))
-            common_ids = user_courses.intersection(foaf_course_ids)
-            common_courses = [c.name for c in foaf_course_qs if c.id in common_ids]
+@login_required
+async def dashboard_async(request):
+    # Used instead of dashboard() when NETWORK_ASYNC_DASHBOARD is on (ASGI).
+    # The page takes as long as its slowest stage, and a stage that times
+    # out is left out; see network/dashboard.py.
+    user = await request.auser()
+    user_profile, created = await UserProfile.objects.aget_or_create(
+        user=user,
+        defaults=DASHBOARD_PROFILE_DEFAULTS,
+    )
+    context = await abuild_dashboard_context(user_profile, page=_dashboard_page(request))
+    # Templates may still touch the database (e.g. a profile's user)
+    return await sync_to_async(_dashboard_response)(request, context)
 
-            foaf_days = set(profile.available_weekdays or [])
-            shared_days_codes = user_days.intersection(foaf_days)
-            shared_days_names = [weekday_labels[code] for code in shared_days_codes]
 
-            profile.shared_days = shared_days_names
-            profile.common_courses = common_courses
+def _profile_id(request):
+    return UserProfile.objects.filter(user=request.user).values_list('id', flat=True).first()
 
-            # Dynamically add attribute
-            foaf_suggestions.append(profile)
 
-    for foaf in foaf_suggestions:
-        print(foaf.user)
-        print(foaf.id)
-        print(foaf.major)
-        print(foaf.school)
-        print(foaf.year_of_study)
-        print(foaf.study_style)
-        print(foaf.available_weekdays)
-        print(foaf.usercourse_set.all())
-        print(foaf.bio)
-        print(foaf.profile_pic)
+def _buddies_page_stamps(request):
+    profile_id = _profile_id(request)
+    return [profile_page_stamp(profile_id), buddies_page_stamp(profile_id)], ()
 
-        print("=" * 40)
 
+def _profile_page_stamps(request):
+    return [profile_page_stamp(_profile_id(request)), COURSES_PAGE_STAMP], ()
 
-    incoming_invites = StudyBuddyInvite.objects.filter(
-        receiver=user_profile,
-        status='pending'
-    ).select_related('sender')
 
-    return render(request, 'network/dashboard.html', {
-        'suggestions': suggestions,
-        'user_profile': user_profile,
-        'incoming_invites': incoming_invites,
-        'week_days_map': {0: 'Mon', 1: 'Tue', 2: 'Wed', 3: 'Thu', 4: 'Fri', 5: 'Sat', 6: 'Sun'},
-        'foaf_suggestions': foaf_suggestions,
-    })
+def _events_page_stamps(request):
+    # "Upcoming" moves on at midnight, and each page of the feed is its own resource
+    stamps = [profile_page_stamp(_profile_id(request)), EVENTS_PAGE_STAMP]
+    return stamps, (timezone.localdate(), request.GET.get('after', ''))
+
 
 @login_required
+@conditional_page(_buddies_page_stamps)
 def view_study_buddies(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
 
-    study_buddies = StudyBuddy.objects.filter(
-    Q(participant_one=user_profile)
-    | Q(participant_two=user_profile))
+    study_buddies = UserProfile.objects.buddies_of(user_profile) \
+        .select_related('user') \
+        .order_by('user__username')
 
     return render(
         request,
@@ -138,6 +150,7 @@ def view_study_buddies(request):
 
 
 @login_required
+@conditional_page(_profile_page_stamps)
 def profile_view(request):
     profile = UserProfile.objects.get(user=request.user)
     courses = profile.courses.all()
@@ -155,17 +168,8 @@ def profile_edit(request):
         form = UserProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
             form.save()
-            # Handle enrolled courses
-            new_courses = form.cleaned_data['enrolled_courses']
-            current_courses = profile.courses.all()
-
-            # Add new UserCourse objects
-            for course in new_courses:
-                UserCourse.objects.get_or_create(user_profile=profile, course=course)
-            # Remove stale ones (Optional)
-            for course in current_courses:
-                if course not in new_courses:
-                    UserCourse.objects.filter(user_profile=profile, course=course).delete()
+            # Handle enrolled courses (one delete and one insert for the whole diff)
+            profile.set_courses(form.cleaned_data['enrolled_courses'])
 
             # Save available_weekdays separately if you store as list
             profile.available_weekdays = form.cleaned_data['available_weekdays']
@@ -178,6 +182,27 @@ def profile_edit(request):
     return render(request, 'network/profile_edit.html', {'form': form})
 
 
+@login_required
+def course_search(request):
+    # Autocomplete for the profile form: ?q=<code prefix or part of a name>&page=<n>
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', COURSE_SEARCH_PAGE_SIZE)), 1), COURSE_SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': "page and page_size must be numbers"}, status=400)
+
+    with span('courses.search'):
+        courses, has_next = search_courses(request.GET.get('q', ''), page=page, page_size=page_size)
+    return JsonResponse({
+        'results': [
+            {'id': course.id, 'code': course.code, 'name': course.name, 'label': str(course)}
+            for course in courses
+        ],
+        'page': page,
+        'has_next': has_next,
+    })
+
+
 @require_POST
 @login_required
 def send_invite(request, receiver_id):
@@ -201,9 +226,8 @@ def send_invite(request, receiver_id):
 @login_required
 def accept_invite(request, invite_id):
     try:
-        invite = StudyBuddyInvite.objects.get(id=invite_id, receiver__user=request.user)
-        invite.status = 'accepted'
-        invite.save()
+        invite = StudyBuddyInvite.objects.select_related('sender__user').get(id=invite_id, receiver__user=request.user)
+        invite.accept()
         messages.success(request, f"Accepted invite from {invite.sender.user.username}")
     except StudyBuddyInvite.DoesNotExist:
         messages.error(request, "Invalid invite.")
@@ -226,89 +250,254 @@ def reject_invite(request, invite_id):
 def direct_message_inbox(request):
     user_profile = request.user.userprofile
 
-    buddy_links = StudyBuddy.objects.filter(
-        Q(participant_one=user_profile) | Q(participant_two=user_profile)
-    )
-    buddies = [bl.participant_two if bl.participant_one == user_profile else bl.participant_one for bl in buddy_links]
+    return render(request, 'network/direct_message_inbox.html', {
+        'buddies': inbox_summary(user_profile),
+        'user_profile': user_profile,
+    })
+
+
+@login_required
+def direct_message_conversation(request, buddy_id):
+    user_profile = request.user.userprofile
+    buddy = get_object_or_404(UserProfile.objects.select_related('user'), id=buddy_id)
+    if not are_buddies(user_profile, buddy):
+        messages.error(request, "You can only message your study buddies.")
+        return redirect('direct_message_inbox')
 
     # Handle message POST
     if request.method == "POST":
-        buddy_id = request.POST.get('buddy_id')
-        buddy = get_object_or_404(UserProfile, id=buddy_id)
         form = DirectMessageForm(request.POST)
         if form.is_valid():
             msg = form.save(commit=False)
             msg.sender = user_profile
             msg.receiver = buddy
             msg.save()
-            return redirect('direct_message_inbox')
-
-    # Always reload all chats
-    chats = []
-    for buddy in buddies:
-        conversation = DirectMessage.objects.filter(
-            Q(sender=user_profile, receiver=buddy) |
-            Q(sender=buddy, receiver=user_profile)
-        ).order_by('timestamp')
-        chats.append({
-            'buddy': buddy,
-            'conversation': conversation,
-            'form': DirectMessageForm(),
-        })
-
-    return render(request, 'network/direct_message_inbox.html', {
-        'chats': chats,
+            if request.headers.get('Accept') == 'application/json':
+                # Sent from the page's script; no need to reload anything
+                return JsonResponse(message_event(msg), status=201)
+            return redirect('direct_message_conversation', buddy_id=buddy.id)
+        if request.headers.get('Accept') == 'application/json':
+            return JsonResponse({'errors': form.errors}, status=400)
+    else:
+        form = DirectMessageForm()
+
+    before = request.GET.get('before')
+    conversation, older_cursor = conversation_page(user_profile, buddy, before=before)
+    if not before:
+        mark_conversation_read(user_profile, buddy)
+
+    return render(request, 'network/direct_message_conversation.html', {
+        'buddy': buddy,
+        'conversation': conversation,
+        'older_cursor': older_cursor,
+        'form': form,
         'user_profile': user_profile,
     })
 
 
+@require_POST
 @login_required
-def study_graph_image(request):
-    import matplotlib.pyplot as plt
+def direct_message_mark_read(request, buddy_id):
+    user_profile = request.user.userprofile
+    buddy = get_object_or_404(UserProfile, id=buddy_id)
+    if not are_buddies(user_profile, buddy):
+        # Read receipts go onto the other user's channel; buddies only
+        raise Http404("No such conversation")
+    mark_conversation_read(user_profile, buddy)
+    return HttpResponse(status=204)
+
+
+MESSAGE_STREAM_KEEPALIVE = 20  # seconds
+
+
+@login_required
+async def direct_message_stream(request):
+    # Server-sent events with new messages and read receipts for this user.
+    # Meant for the ASGI deployment; each open page holds one connection.
+    user = await request.auser()
+    profile_id = await UserProfile.objects.filter(user=user).values_list('id', flat=True).aget()
+
+    async def events():
+        subscription = get_broker().subscribe(user_channel(profile_id))
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = await subscription.get(timeout=MESSAGE_STREAM_KEEPALIVE)
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+GRAPH_IMAGE_CACHE_KEY = 'network:graph_png:{user_id}:{view}:{graph_version}:{index_version}'
+GRAPH_IMAGE_CACHE_TIMEOUT = 60 * 60
+
+# ?mode=ego draws only the k-hop neighbourhood around the user
+EGO_DEFAULT_RADIUS = 2
+EGO_MAX_RADIUS = 4
+EGO_DEFAULT_MAX_NODES = 150
+EGO_MAX_NODES = 500
+
+
+def _bounded_int_param(request, name, default, minimum, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, minimum), maximum)
+
 
+@login_required
+def study_graph_image(request):
     user = request.user
     user_profile = UserProfile.objects.get(user=user)
     user_id = str(user_profile.pk)
-    G = build_study_network_graph()
 
-    # Gather study buddies
-    buddy_qs = StudyBuddy.objects.filter(
-        Q(participant_one=user_profile) | Q(participant_two=user_profile)
+    ego_mode = request.GET.get('mode') == 'ego'
+    if ego_mode:
+        radius = _bounded_int_param(request, 'radius', EGO_DEFAULT_RADIUS, 1, EGO_MAX_RADIUS)
+        max_nodes = _bounded_int_param(request, 'max_nodes', EGO_DEFAULT_MAX_NODES, 1, EGO_MAX_NODES)
+        view = f'ego-{radius}-{max_nodes}'
+    else:
+        view = 'full'
+
+    # The picture only changes when the graph or the suggestion index does
+    cache_key = GRAPH_IMAGE_CACHE_KEY.format(
+        user_id=user_id,
+        view=view,
+        graph_version=study_graph_store.current_version(),
+        index_version=suggestion_index.current_version(),
     )
-    buddy_profiles = set()
-    for sb in buddy_qs:
-        if sb.participant_one == user_profile:
-            buddy_profiles.add(sb.participant_two.pk)
-        else:
-            buddy_profiles.add(sb.participant_one.pk)
-    buddies = [str(pk) for pk in buddy_profiles]
-
-    # Gather recommendations (suggested buddies + FOAFs)
-    suggested_profiles = [str(sug['profile'].pk) for sug in get_suggested_study_buddies(user_profile)]
-    foaf_profiles = [str(foaf['id']) for foaf in get_foaf_recommendations(user_profile)]
-    recommendations = list(set(suggested_profiles + foaf_profiles) - set(buddies) - {user_id})
-
-    # Draw and return as image
-    buf = io.BytesIO()
-    draw_study_network_graph(
+    # A client holding this version gets a 304 before any cache or render work
+    response, etag = not_modified(request, [cache_key])
+    if response is not None:
+        incr('graph_image.not_modified')
+        return response
+
+    png = cache.get(cache_key)
+    if png is not None:
+        incr('graph_image.cache_hits')
+        return set_validators(HttpResponse(png, content_type='image/png'), etag)
+    incr('graph_image.cache_misses')
+
+    # Gather study buddies
+    buddy_ids = BuddyLink.objects.filter(owner=user_profile).values_list('buddy_id', flat=True)
+    buddies = [str(pk) for pk in buddy_ids]
+
+    # Gather recommendations: the same top suggestions and FOAFs as the JSON
+    # view, best first, so the ego view's node cap keeps the best of them
+    excluded = {user_id, *buddies}
+    recommendations = list(dict.fromkeys(
+        str(rec['id']) for rec in recommendations_for(user_profile) if str(rec['id']) not in excluded
+    ))
+
+    if ego_mode:
+        G, graph_version = study_graph_store.ego_snapshot(
+            user_profile.pk, radius, max_nodes,
+            extra_nodes=[int(pk) for pk in recommendations],
+        )
+        # Small enough to lay out from scratch every time
+        pos, initial_pos, iterations = None, None, LAYOUT_ITERATIONS
+    else:
+        G, graph_version = study_graph_store.versioned_snapshot()
+        pos, initial_pos, iterations = plan_study_graph_layout(G, graph_version)
+
+    job = graph_render_job(
         G,
         user_node=user_id,
         buddy_nodes=buddies,
-        recommendation_nodes=recommendations
+        recommendation_nodes=recommendations,
+        pos=pos,
+        initial_pos=initial_pos,
+        iterations=iterations,
     )
-    plt.savefig(buf, format='png')
-    plt.close()
-    buf.seek(0)
-    return HttpResponse(buf.getvalue(), content_type='image/png')
+    job_key = GRAPH_IMAGE_CACHE_KEY.format(
+        user_id=user_id,
+        view=view,
+        graph_version=graph_version,
+        index_version=suggestion_index.current_version(),
+    )
+
+    def rendered(png, layout):
+        # Runs when the worker finishes, even if this request gave up waiting
+        cache.set(job_key, png, GRAPH_IMAGE_CACHE_TIMEOUT)
+        if not ego_mode and pos is None:
+            store_study_graph_layout(graph_version, layout)
+
+    try:
+        with span('graph_image.render_wait'):
+            png, _ = render_pool.render(job_key, job, on_done=rendered)
+    except (RenderQueueFull, FutureTimeoutError):
+        incr('graph_image.unavailable')
+        # Still rendering (or too busy); the page retries the image shortly
+        response = HttpResponse(status=503)
+        response['Retry-After'] = '2'
+        return response
+    except Exception:
+        # A worker died or the job raised; the pool replaces broken workers
+        logger.exception("Rendering graph image %s failed", job_key)
+        incr('graph_image.failed')
+        response = HttpResponse(status=503)
+        response['Retry-After'] = '2'
+        return response
+    if job_key != cache_key:
+        # The graph moved on while we were looking; label the image with what was drawn
+        etag = etag_for([job_key], weak=False)
+    return set_validators(HttpResponse(png, content_type='image/png'), etag)
+
+@login_required
+def study_graph_data(request):
+    # Nodes and edges as JSON for drawing in the browser; see network/graph_data.py
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    scope = 'network' if request.GET.get('scope') == 'network' else 'user'
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+
+    with span('graph_data.build'):
+        data = graph_data(user_profile, scope=scope, since=since)
+    incr(f"graph_data.{data['mode']}")
+    response = StreamingHttpResponse(stream_graph_data(data), content_type='application/json')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 
 @login_required
 def study_graph(request):
     return render(request, "study_graph.html")
 
 
+def profile_pic_thumbnail(request, name):
+    # Thumbnail names are content hashes, so a response never goes stale.
+    # In production the web server should serve media/ with the same headers.
+    path = f'{THUMBNAIL_DIR}/{name}'
+    try:
+        file = default_storage.open(path)
+    except (FileNotFoundError, ValueError):
+        raise Http404("No such thumbnail")
+    response = FileResponse(file, content_type='image/webp')
+    patch_cache_control(response, public=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
+    return response
+
+
+@staff_member_required
+def network_metrics(request):
+    # Spans and counters from network/instrumentation.py, for this process only
+    return JsonResponse(metrics_snapshot())
+
+
 from django.db.models import Q  # For sophisticated querying
 
 @login_required
+@conditional_page(_events_page_stamps)
 def events_page(request):
     user_profile = UserProfile.objects.get(user=request.user)
     # Handle event creation POST
@@ -331,14 +520,13 @@ def events_page(request):
         )
         return redirect("events_page")
 
-    # Prepare event list for this user
-    events = Event.objects.filter(
-        Q(target_school=user_profile.school) |
-        Q(target_major=user_profile.major)
-    ).distinct().order_by("-date")
+    # Upcoming events for this user, a page at a time
+    events, next_cursor = upcoming_events_page(user_profile, after=request.GET.get('after'))
 
     return render(request, "network/events_page.html", {
         "events": events,
+        "next_cursor": next_cursor,
+        "paged": bool(request.GET.get('after')),
         "school_choices": SCHOOL_CHOICES,
         "major_choices": UserProfile._meta.get_field("major").choices,
     })
\ No newline at end of file
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # OpClass and the trigram extension for course search indexes
     'network',
     'crispy_forms',
     'crispy_bootstrap4',
@@ -136,3 +137,65 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Cache
+# network/versioning.py keeps its shared version counters here, which is how
+# worker processes learn that the in-memory study graph changed elsewhere.
+# Point this at Redis or Memcached when running more than one process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Study graph images are rendered by a process pool (network/rendering.py)
+
+GRAPH_RENDER_WORKERS = 2
+GRAPH_RENDER_QUEUE_LIMIT = 16  # distinct images queued or rendering at once
+GRAPH_RENDER_TIMEOUT = 10  # seconds a request waits before answering 503
+
+# Live direct messages (server-sent events, needs the ASGI server).
+# InMemoryBroker only reaches clients connected to the same process.
+NETWORK_PUBSUB_BACKEND = 'network.pubsub.InMemoryBroker'
+
+# Async dashboard for the ASGI deployment: suggestions, FOAFs and invites
+# are loaded at the same time, at most DASHBOARD_STAGE_CONCURRENCY at once
+# per process, and a part that takes longer than its timeout (seconds) is
+# left off the page.
+NETWORK_ASYNC_DASHBOARD = False
+DASHBOARD_STAGE_CONCURRENCY = 8
+DASHBOARD_STAGE_TIMEOUT = 2.0
+DASHBOARD_STAGE_TIMEOUTS = {'foaf': 1.5}
+
+# Logging
+# Recommendation and graph code logs under the "network" logger. Debug detail
+# is sampled (network/instrumentation.py): set NETWORK_DEBUG_SAMPLE_RATE to a
+# fraction such as 0.01 and the "network" level to DEBUG to see it.
+
+NETWORK_DEBUG_SAMPLE_RATE = 0.0
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'network': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+# Per-user recommendation cache (network/rec_cache.py): entries kept in this
+# process, and how long entries live in the shared cache (seconds)
+
+REC_CACHE_LRU_SIZE = 1024
+REC_CACHE_TIMEOUT = 600
+
+# compute_recommendations worker processes (None: one per CPU)
+REC_BATCH_WORKERS = None